@@ -11,7 +11,8 @@ License: BSD
 """
 
 # Standard library imports
-import time
+import os
+import sys
 
 # Major package imports
 import numpy as np
@@ -31,48 +32,10 @@ from enthought.chaco.scales_tick_generator import ScalesTickGenerator
 from enthought.chaco.axis import PlotAxis as ScalesPlotAxis
 from enthought.enable.component_editor import ComponentEditor
 
-
-# Helper function to load data
-def read_time_series_from_csv(filename, dtype=['float32', 'float32', 'float32'], first_line_header=True, separator=',', date_col=None, date_format="%d/%b/%y"):
-    """ Read a csv file of N columns.
-        Parameters:
-          - filename: string for file path and name.
-          - dtype: list of valid dtype codes to cast column values into
-          - first_line_header: True/False does the first line of the csv
-                contain header labels?
-          - separator: in case the csv file is "X"sv.
-          - date_col: special case for time series data to specify which col contains
-                text representing a date.
-          - date_format: normal python date string format codes for translating date
-                string into seconds since the Epoch
-    """
-
-    cast = np.cast
-    data = [[] for placeholder in xrange(len(dtype))]
-    linecount=0
-    for line in open(filename, 'r'):
-        if linecount!=0 or not first_line_header:
-            fields = line.strip().split(separator)
-            data[0].append
-            for i, number in enumerate(fields):
-                # make sure there are no "quotes" around the date text
-                dt = number.strip("\"")
-                if i==date_col:
-                    data[i].append(time.mktime(time.strptime(dt, date_format)))
-                else:
-                    data[i].append(number)
-        else:
-            tmpdtype = []
-            names = line.strip().split(separator)
-            for i, name in enumerate(names):
-                print i, name
-                tmpdtype.append(tuple([name.strip("\""), dtype[i]]))
-            dtype = np.dtype(tmpdtype)
-
-        linecount=1
-    for i in xrange(len(dtype)):
-        data[i] = cast[dtype[i]](data[i])
-    return np.rec.array(data, dtype=dtype)
+# Local imports
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from ts_utils import range_slice, read_time_series_from_csv
 
 
 class CyclesPlot(HasTraits):
@@ -242,15 +205,14 @@ class CyclesPlot(HasTraits):
         sels = self.plot.plot_components[1].plots['x'][0].index.metadata['selections']
         
         if not sels is None:
-            p = self._dates>=sels[0]
-            q = self._dates<=sels[1]
-            msk = p & q
+            # The dates are sorted, so select a view of the series
+            sel = range_slice(self._dates, sels[0], sels[1])
 
-            self._selected_s1 = self._series1[msk]
-            self._selected_s2 = self._series2[msk]
+            self._selected_s1 = self._series1[sel]
+            self._selected_s2 = self._series2[sel]
 
-            # Find the index of the last point in the mask
-            last_idx = -(msk[::-1].argmax()+1)
+            # Index of the last point in the selection
+            last_idx = sel.stop-1 if sel.stop > sel.start else -1
             endpoint_x = np.array([self._series1[last_idx]])
             endpoint_y = np.array([self._series2[last_idx]])
 
@@ -1,4 +1,5 @@
-import time
+import os
+import sys
 
 import numpy as np
 from numpy import linspace
@@ -17,47 +18,9 @@ from chaco.scales.api import CalendarScaleSystem
 from chaco.scales_tick_generator import ScalesTickGenerator
 from chaco.axis import PlotAxis as ScalesPlotAxis
 
-
-# Helper function to load data
-def read_time_series_from_csv(filename, dtype=['float32', 'float32', 'float32'], first_line_header=True, separator=',', date_col=None, date_format="%d/%b/%y"):
-    """ Read a csv file of N columns.
-        Parameters:
-          - filename: string for file path and name.
-          - dtype: list of valid dtype codes to cast column values into
-          - first_line_header: True/False does the first line of the csv
-                contain header labels?
-          - separator: in case the csv file is "X"sv.
-          - date_col: special case for time series data to specify which col contains
-                text representing a date.
-          - date_format: normal python date string format codes for translating date
-                string into seconds since the Epoch
-    """
-
-    cast = np.cast
-    data = [[] for placeholder in xrange(len(dtype))]
-    linecount=0
-    for line in open(filename, 'r'):
-        if linecount!=0 or not first_line_header:
-            fields = line.strip().split(separator)
-            data[0].append
-            for i, number in enumerate(fields):
-                # make sure there are no "quotes" around the date text
-                dt = number.strip("\"")
-                if i==date_col:
-                    data[i].append(time.mktime(time.strptime(dt, date_format)))
-                else:
-                    data[i].append(number)
-        else:
-            tmpdtype = []
-            names = line.strip().split(separator)
-            for i, name in enumerate(names):
-                tmpdtype.append(tuple([name.strip("\""), dtype[i]]))
-            dtype = np.dtype(tmpdtype)
-
-        linecount=1
-    for i in xrange(len(dtype)):
-        data[i] = cast[dtype[i]](data[i])
-    return np.rec.array(data, dtype=dtype)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from ts_utils import range_slice, read_time_series_from_csv
 
 
 class MLabChacoPlot(HasTraits):
@@ -160,14 +123,12 @@ class MLabChacoPlot(HasTraits):
     def update_interval(self, selected):
         
         if not selected is None:
-            p = self.prices['Date']>=selected[0]
-            q = self.prices['Date']<=selected[1]
-            msk = p & q
-            x, y, z, scalars = self.prices['Gasoline Supply'][msk], self.prices['Jet Fuel Supply'][msk], self.prices['Distillate Supply'][msk], self.prices['Crude Supply'][msk]
+            # The dates are sorted, so the selection is one run of points
+            sel = range_slice(self.prices['Date'], selected[0], selected[1])
             
             self.m.glyph.mask_input_points = True
-            self.m.glyph.mask_points.offset = int(msk.argmax())
-            self.m.glyph.mask_points.maximum_number_of_points = len(x)
+            self.m.glyph.mask_points.offset = int(sel.start)
+            self.m.glyph.mask_points.maximum_number_of_points = sel.stop - sel.start
             
             self.m.update_data()
         
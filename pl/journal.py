@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+journal.py
+
+Journal of realized gains: one record per piece of an open lot closed by a
+removal from a Holding.  Records are kept as columns of preallocated arrays
+that double in size when full, so posting is a handful of array stores and
+a whole book's tax lots can be reported from the journal directly.
+
+Copyright (c) 2012 Vaught Consulting.
+
+License: BSD
+
+"""
+
+# Major package imports
+import numpy as np
+
+# Layout of the records returned by Journal.to_array.  holding_period is in
+#   the units of Position.trans_date (seconds).
+journal_dtype = np.dtype([("symbol", "S50"),
+                          ("open_id", "S32"),
+                          ("close_id", "S32"),
+                          ("qty", "f8"),
+                          ("cost_basis", "f8"),
+                          ("proceeds", "f8"),
+                          ("fees", "f8"),
+                          ("holding_period", "f8")])
+
+
+class Journal(object):
+    """ Columnar journal of realized gains.
+
+        Parameters:
+          - capacity: number of records to allocate room for up front
+    """
+
+    def __init__(self, capacity=16):
+        self._size = 0
+        self._columns = dict((name, np.empty(max(capacity, 1),
+                                             journal_dtype[name]))
+                             for name in journal_dtype.names)
+
+    def post(self, symbol, open_id, close_id, qty, cost_basis, proceeds,
+             fees, holding_period):
+        """ Appends one realized gain record. """
+
+        if self._size == len(self._columns["qty"]):
+            self._grow(2*self._size)
+        i = self._size
+        columns = self._columns
+        columns["symbol"][i] = symbol
+        columns["open_id"][i] = open_id
+        columns["close_id"][i] = close_id
+        columns["qty"][i] = qty
+        columns["cost_basis"][i] = cost_basis
+        columns["proceeds"][i] = proceeds
+        columns["fees"][i] = fees
+        columns["holding_period"][i] = holding_period
+        self._size += 1
+
+    def extend(self, other):
+        """ Appends all the records of another journal. """
+
+        size = self._size + len(other)
+        if size > len(self._columns["qty"]):
+            self._grow(max(size, 2*self._size))
+        for name, column in self._columns.iteritems():
+            column[self._size:size] = other[name]
+        self._size = size
+
+    def _grow(self, capacity):
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def __getitem__(self, name):
+        """ Returns a read-only view of the named column. """
+        column = self._columns[name][:self._size]
+        column.flags.writeable = False
+        return column
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def pnl(self):
+        """ Realized gain of each record: proceeds - cost_basis - fees """
+        return self["proceeds"] - self["cost_basis"] - self["fees"]
+
+    def to_array(self):
+        """ Returns a copy of the records as a structured array of
+            journal_dtype.
+        """
+
+        records = np.empty(self._size, journal_dtype)
+        for name in journal_dtype.names:
+            records[name] = self._columns[name][:self._size]
+        return records
+
+
+#### EOF ####################################################################
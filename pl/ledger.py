@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+ledger.py
+
+Batch lot matching for a whole statement of trades.  Rather than feeding
+Positions one at a time through a Holding, the trades for every symbol are
+matched in one pass over arrays, giving a table of realized P/L (one row
+per matched piece of an opening and a closing trade) and a table of the
+lots still open.
+
+'fifo' matching needs no loop at all: within a symbol the n-th share
+bought is closed by the n-th share sold (and vice versa for shorts), so
+laying the running totals of shares bought and shares sold along one axis
+and cutting it at every trade boundary gives each matched piece directly.
+'lifo' matching walks the trades of each symbol with a stack.
+
+Copyright (c) 2012 Vaught Consulting.
+
+License: BSD
+
+"""
+
+# Standard library imports
+import math
+
+# Major package imports
+import numpy as np
+import pandas
+
+# Quantities smaller than this are treated as zero (rounding in the running
+#   totals of fractional fund shares)
+QTY_TOL = 1e-6
+
+# Columns of the trades table taken by match_lots
+TRADE_COLUMNS = ["symbol", "id", "date", "qty", "price", "gross", "fee"]
+
+
+def trades_from_statement(df, date_format="%m/%d/%Y"):
+    """ Picks the trades out of a broker statement.
+
+        Parameters:
+          - df: DataFrame of the statement csv, with DATE, TRANSACTION ID,
+                DESCRIPTION, QUANTITY, SYMBOL, PRICE, COMMISSION, AMOUNT and
+                REG FEE columns
+          - date_format: format of the DATE column
+
+        Returns a DataFrame with TRADE_COLUMNS, one row per "Bought" or
+        "Sold" entry.  qty is signed (negative for sales), fee is the
+        commission plus the regulatory fee and gross is the value of the
+        trade before fees, taken from AMOUNT so that contract multipliers
+        are included.
+    """
+
+    description = df["DESCRIPTION"].fillna("")
+    bought = description.str.startswith("Bought").values
+    sold = description.str.startswith("Sold").values
+    df = df[bought | sold]
+    sign = np.where(bought[bought | sold], 1.0, -1.0)
+
+    # Allow the fees to be summed by replacing nans with 0.0s
+    fee = (df["COMMISSION"].fillna(0.0) + df["REG FEE"].fillna(0.0)).values
+
+    return pandas.DataFrame({
+        "symbol": df["SYMBOL"].values,
+        "id": df["TRANSACTION ID"].values,
+        "date": pandas.to_datetime(df["DATE"], format=date_format).values,
+        "qty": sign*df["QUANTITY"].values,
+        "price": df["PRICE"].values,
+        # AMOUNT is the cash moved, i.e. -(gross + fee) for a buy and
+        #   gross - fee for a sale
+        "gross": np.abs(df["AMOUNT"].values + fee),
+        "fee": fee}, columns=TRADE_COLUMNS)
+
+
+def match_lots(trades, order="fifo"):
+    """ Matches the closing trades of each symbol against its open lots.
+
+        Parameters:
+          - trades: DataFrame with TRADE_COLUMNS (see trades_from_statement);
+                qty is positive for buys and negative for sales
+          - order: 'fifo' or 'lifo'
+
+        Returns (realized, open_lots), two DataFrames.  realized has a row
+        per matched piece of an opening and a closing trade:
+            symbol, open_id, close_id, open_date, close_date, qty,
+            cost_basis, proceeds, fees, pnl
+        where qty is negative for a short lot, fees are both trades' fees
+        prorated by shares, and pnl = proceeds - cost_basis - fees.
+        open_lots has a row per lot still open:
+            symbol, id, date, qty, price, cost_basis, fees
+
+        Trades of a symbol are matched in date order; trades on the same
+        date keep the order they have in the table.
+    """
+
+    if order not in _matchers:
+        raise ValueError("Unknown lot order %r" % order)
+
+    codes, symbols = pandas.factorize(trades["symbol"].values)
+    dates = trades["date"].values
+    rows = np.lexsort((np.arange(len(trades)), dates, codes))
+    rows = rows[trades["qty"].values[rows] != 0]
+
+    codes = codes[rows]
+    qty = trades["qty"].values[rows].astype(float)
+    pairs, remnants = _matchers[order](codes, qty)
+
+    sorted_trades = dict((name, trades[name].values[rows])
+                         for name in TRADE_COLUMNS)
+    sorted_trades["symbol"] = symbols[codes]
+    sorted_trades["qty"] = qty
+    return (_realized_table(sorted_trades, *pairs),
+            _open_table(sorted_trades, *remnants))
+
+
+def _fifo_pairs(codes, qty):
+    """ Matches trades first-in-first-out with array operations.
+
+        codes and qty are the symbol codes and signed quantities of the
+        trades, grouped by symbol and in date order within each group.
+        Returns ((open_row, close_row, shares), (row, qty)): the matched
+        pieces and the unmatched remainders of trades.
+    """
+
+    if not len(qty):
+        empty = np.zeros(0, int)
+        return (empty, empty, np.zeros(0)), (empty, np.zeros(0))
+
+    bought = np.where(qty > 0, qty, 0.0)
+    sold = np.where(qty < 0, -qty, 0.0)
+
+    # Each symbol gets its own stretch of the axis, long enough for both
+    #   its shares bought and its shares sold.
+    nsymbols = codes[-1] + 1
+    total_bought = np.bincount(codes, bought, nsymbols)
+    total_sold = np.bincount(codes, sold, nsymbols)
+    span = np.maximum(total_bought, total_sold)
+    base = np.concatenate(([0.0], np.cumsum(span)[:-1]))
+
+    # Where each trade's shares end on the axis
+    bought_end = base[codes] + _group_cumsum(bought, codes, total_bought)
+    sold_end = base[codes] + _group_cumsum(sold, codes, total_sold)
+
+    # Cut the axis at every boundary; each piece is one buy against one
+    #   sale, or the unmatched tail of a trade.
+    cuts = np.unique(np.concatenate((base, base + span, bought_end, sold_end)))
+    shares = np.diff(cuts)
+    keep = shares > QTY_TOL
+    shares = shares[keep]
+    mid = (cuts[:-1] + 0.5*np.diff(cuts))[keep]
+
+    piece_code = np.searchsorted(base, mid, side="right") - 1
+    buy_row = np.searchsorted(bought_end, mid, side="right")
+    sell_row = np.searchsorted(sold_end, mid, side="right")
+    has_buy = mid < base[piece_code] + total_bought[piece_code]
+    has_sale = mid < base[piece_code] + total_sold[piece_code]
+
+    # Pieces that are a whole trade get that trade's qty exactly, rather
+    #   than a difference of running totals
+    last = len(qty) - 1
+    whole = np.minimum(
+        np.where(has_buy, bought[np.minimum(buy_row, last)], np.inf),
+        np.where(has_sale, sold[np.minimum(sell_row, last)], np.inf))
+    shares = np.where(np.abs(shares - whole) <= QTY_TOL, whole, shares)
+
+    matched = has_buy & has_sale
+    open_row = np.minimum(buy_row, sell_row)[matched]
+    close_row = np.maximum(buy_row, sell_row)[matched]
+    order = np.lexsort((open_row, close_row))
+
+    remnant_row = np.where(has_buy, buy_row, sell_row)[~matched]
+    remnant_qty = np.where(has_buy, shares, -shares)[~matched]
+
+    return ((open_row[order], close_row[order], shares[matched][order]),
+            (remnant_row, remnant_qty))
+
+
+def _lifo_pairs(codes, qty):
+    """ Matches trades last-in-first-out, walking each symbol's trades with
+        a stack of open lots.  Arguments and result are as for _fifo_pairs.
+    """
+
+    open_rows, close_rows, shares = [], [], []
+    remnants = []
+    quantities = qty.tolist()
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(codes)) + 1))
+    stops = np.concatenate((starts[1:], [len(codes)]))
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        stack = []
+        for row in xrange(start, stop):
+            remaining = quantities[row]
+            while stack and (stack[-1][1] > 0) != (remaining > 0):
+                lot = stack[-1]
+                matched = min(abs(remaining), abs(lot[1]))
+                open_rows.append(lot[0])
+                close_rows.append(row)
+                shares.append(matched)
+                lot[1] -= math.copysign(matched, lot[1])
+                remaining -= math.copysign(matched, remaining)
+                if abs(lot[1]) <= QTY_TOL:
+                    stack.pop()
+                if abs(remaining) <= QTY_TOL:
+                    break
+            else:
+                stack.append([row, remaining])
+        remnants.extend(stack)
+
+    remnants.sort()
+    return ((np.array(open_rows, int), np.array(close_rows, int),
+             np.array(shares, float)),
+            (np.array([lot[0] for lot in remnants], int),
+             np.array([lot[1] for lot in remnants], float)))
+
+
+_matchers = {"fifo": _fifo_pairs, "lifo": _lifo_pairs}
+
+
+def _group_cumsum(values, codes, totals):
+    """ Running sum of values restarting at each new code. """
+    before = np.concatenate(([0.0], np.cumsum(totals)[:-1]))
+    return np.cumsum(values) - before[codes]
+
+
+def _realized_table(trades, open_row, close_row, shares):
+    qty = trades["qty"]
+    unit = trades["gross"]/np.abs(qty)
+    long_lot = qty[open_row] > 0
+    buy_row = np.where(long_lot, open_row, close_row)
+    sell_row = np.where(long_lot, close_row, open_row)
+
+    cost_basis = shares*unit[buy_row]
+    proceeds = shares*unit[sell_row]
+    fees = (trades["fee"][open_row]*shares/np.abs(qty[open_row]) +
+            trades["fee"][close_row]*shares/np.abs(qty[close_row]))
+
+    return pandas.DataFrame({
+        "symbol": trades["symbol"][open_row],
+        "open_id": trades["id"][open_row],
+        "close_id": trades["id"][close_row],
+        "open_date": trades["date"][open_row],
+        "close_date": trades["date"][close_row],
+        "qty": np.where(long_lot, shares, -shares),
+        "cost_basis": cost_basis,
+        "proceeds": proceeds,
+        "fees": fees,
+        "pnl": proceeds - cost_basis - fees},
+        columns=["symbol", "open_id", "close_id", "open_date", "close_date",
+                 "qty", "cost_basis", "proceeds", "fees", "pnl"])
+
+
+def _open_table(trades, row, remaining):
+    share_ratio = np.abs(remaining/trades["qty"][row])
+    return pandas.DataFrame({
+        "symbol": trades["symbol"][row],
+        "id": trades["id"][row],
+        "date": trades["date"][row],
+        "qty": remaining,
+        "price": trades["price"][row],
+        "cost_basis": trades["gross"][row]*share_ratio,
+        "fees": trades["fee"][row]*share_ratio},
+        columns=["symbol", "id", "date", "qty", "price", "cost_basis", "fees"])
+
+
+#### EOF ####################################################################
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+lot_queue.py
+
+Priority queue of the open lots (positions) in a holding.  Lots are pushed
+once and can then be taken off in any of several orders -- 'fifo', 'lifo'
+or 'wifo' -- or by any key function passed in place of an order name.
+Each named order gets its own heap, built the first time the order is used
+and kept up to date on every push after that.  Removing a lot just forgets
+it; the heaps skip forgotten entries when they reach the top.  Only the
+last key function used keeps a heap, dropped on the next push, so a
+removal taking many lots by one key function builds its heap once while
+the queue never holds on to more than one ad hoc function (e.g. lambdas
+made per removal).  The lots are also kept in a list in sort_key order,
+inserted by bisection, so the queue can be walked in date order without
+sorting it.
+
+Copyright (c) 2012 Vaught Consulting.
+
+License: BSD
+
+"""
+
+# Standard library imports
+import bisect
+import heapq
+import itertools
+
+
+def fifo_key(position, seq):
+    """ first-in-first-out: earliest trans_date first """
+    return (position.sort_key, seq)
+
+def lifo_key(position, seq):
+    """ last-in-first-out: latest trans_date first """
+    return (-position.sort_key, -seq)
+
+def wifo_key(position, seq):
+    """ worst-in-first-out: highest price first, so the lots giving the
+        smallest gain (or largest loss) on a sale are closed first
+    """
+    return (-position.price, position.sort_key, seq)
+
+# Order names accepted by LotQueue in place of a key function
+order_keys = {'fifo': fifo_key, 'lifo': lifo_key, 'wifo': wifo_key}
+
+
+class LotQueue(object):
+    """ Open lots, ordered on insert.
+
+        The key function for an order is called as key(position, seq),
+        where seq numbers the lots in the order they were pushed.  A lot's
+        sort_key, and what the key functions compute from it, must not
+        change while it is in the queue.
+    """
+
+    def __init__(self, positions=()):
+        self._seq = itertools.count()
+        self._live = {}
+        self._seqs = {}
+        self._heaps = {}
+        # (key function, heap) of the last key function used, if any
+        self._key_heap = None
+        # (sort_key, seq) of the live lots, in order
+        self._order = []
+        for position in positions:
+            self.push(position)
+
+    def push(self, position):
+        """ Adds a lot to the queue. """
+
+        seq = next(self._seq)
+        self._live[seq] = position
+        self._seqs[id(position)] = seq
+        bisect.insort(self._order, (position.sort_key, seq))
+        self._key_heap = None
+        for order, heap in self._heaps.iteritems():
+            heapq.heappush(heap, (order_keys[order](position, seq), seq))
+
+    def peek(self, order='fifo'):
+        """ Returns the next lot in the given order without removing it.
+            Raises KeyError if the queue is empty.
+        """
+
+        heap = self._heap(order)
+        # Drop entries for lots already removed
+        while heap and heap[0][1] not in self._live:
+            heapq.heappop(heap)
+        if not heap:
+            raise KeyError("No positions in queue")
+        return self._live[heap[0][1]]
+
+    def pop(self, order='fifo'):
+        """ Removes and returns the next lot in the given order. """
+
+        position = self.peek(order)
+        self.remove(position)
+        return position
+
+    def remove(self, position):
+        """ Removes the lot from the queue. """
+
+        seq = self._seqs.pop(id(position))
+        del self._live[seq]
+        del self._order[bisect.bisect_left(self._order,
+                                           (position.sort_key, seq))]
+
+    def _heap(self, order):
+        if isinstance(order, basestring):
+            heap = self._heaps.get(order)
+            if heap is None:
+                heap = self._heaps[order] = self._build_heap(order_keys[order])
+        elif self._key_heap is not None and self._key_heap[0] is order:
+            heap = self._key_heap[1]
+        else:
+            heap = self._build_heap(order)
+            self._key_heap = (order, heap)
+        if len(heap) > 2*len(self._live) + 16:
+            # Mostly removed entries, compact it
+            heap[:] = [entry for entry in heap if entry[1] in self._live]
+            heapq.heapify(heap)
+        return heap
+
+    def _build_heap(self, key):
+        heap = [(key(position, seq), seq)
+                for seq, position in self._live.iteritems()]
+        heapq.heapify(heap)
+        return heap
+
+    def __len__(self):
+        return len(self._live)
+
+    def __iter__(self):
+        """ Iterates over the lots in trans_date order. """
+        return iter([self._live[seq] for key, seq in self._order])
+
+
+#### EOF ####################################################################
@@ -14,6 +14,8 @@ License: BSD
 import pandas
 
 # Local imports
+from journal import Journal
+from lot_queue import LotQueue
 from position import Position
 
 class Portfolio():
@@ -23,13 +25,15 @@ class Portfolio():
         self.name = name
         self.cash_bal = cash_bal
         self.holdings = {}
+        # Realized gains of all the holdings
+        self.journal = Journal()
         if holdings:
             if hasattr(holdings, "symbol"):
-                self.holdings[holdings.symbol] = holdings
+                self.add_holding(holdings)
             #TODO: fix this...assume a list of holdings objects passed in
             else:
                 for itm in holdings:
-                    self.holdings[itm.symbol] = itm
+                    self.add_holding(itm)
 
         return
 
@@ -38,6 +42,10 @@ class Portfolio():
         """
 
         self.holdings[holding.symbol] = holding
+        # Take over the holding's journal so the book has a single one
+        if holding.journal is not self.journal:
+            self.journal.extend(holding.journal)
+            holding.journal = self.journal
         print "Added holding %s" % holding
         return
 
@@ -57,19 +65,28 @@ class Portfolio():
                     position.description, position.qty, position.price, position.total_amt)
                 
 
-class Holding():
+class Holding(object):
     """ Queue for held positions in the same security (as identified
-        by symbol).  The removal of entries are handled in a 'fifo'
-        or a 'lifo' order, depending on the order argument of the
-        remove_from method.
+        by symbol).  The removal of entries are handled in a 'fifo',
+        'lifo' or 'wifo' order, depending on the order argument of the
+        remove_from method.  The gains realized by removals are posted to
+        journal.
     """
 
-    def __init__(self):
+    def __init__(self, journal=None):
         self.qty = 0.0
         self.symbol = ""
-        self.positions = []
+        self.lots = LotQueue()
+        if journal is None:
+            journal = Journal()
+        self.journal = journal
         return
 
+    @property
+    def positions(self):
+        """ The open positions, in trans_date order """
+        return list(self.lots)
+
     def adjust_holding(self, position):
         """ Adjusts a holding based on a provided position argument.
             inputs:
@@ -86,7 +103,7 @@ class Holding():
             self.symbol = position.symbol
         if position.symbol==self.symbol:
             self.qty += position.qty
-            self.positions.append(position)
+            self.lots.push(position)
         else:
             raise AttributeError
         return
@@ -98,92 +115,118 @@ class Holding():
             
             inputs:
                 position - the position causing the alteration
-                order - one of 'fifo' or 'lifo'
+                order - one of 'fifo', 'lifo' or 'wifo', or a key function
+                    for the lots (see lot_queue)
                 
             returns:
                 None
             
             'fifo' - first-in-first-out
             'lifo' - last-in-first-out
+            'wifo' - worst-in-first-out (highest price first)
 
             This method implements a queue reduction of holdings by the amount specified in the
-            provided 'position' quantity (qty).  This method also serves the purpose of populating a 'statement'
-            property -- capturing a P/L amount based on the prior costs.
+            provided 'position' quantity (qty).  This method also serves the purpose of populating the
+            'journal' -- capturing a P/L record for each lot closed, based on the prior costs.
 
             The queueing actually handles the four cases of a) zeroing out a holding, b) reducing a holding
-            c) eliminating a holding and recursing to the next held item, or d) eliminating a holding with no
+            c) eliminating a holding and moving on to the next held item, or d) eliminating a holding with no
             next item, and adding a holding in the other direction.
         """
         
-        if order=='fifo':
-            pos_idx = 0
-        elif order=='lifo':
-            pos_idx = -1
-        
-        if not self.positions:
+        if not self.lots:
             raise KeyError("No positions in Holding to remove")
 
+        while True:
+            idx_pos = self.lots.peek(order)
+            idx_qty = idx_pos.qty
             
-        self.positions.sort()
-        idx_pos = self.positions[pos_idx]
-        idx_qty = idx_pos.qty
-        
-        # Test scenarios for position removal
-        #   First scenario: indicated qty is the same as the position entry
-        #   qty next in the queue.  If so, simply adjust the qty total and 
-        #   remove that entry in the queue.
-        if -position.qty == idx_qty:
-            # Assume an opposite signed qty.
-            self.qty += position.qty
-            del self.positions[pos_idx]
-            
-        # Second scenario: indicated qty is greater than the position entry
-        #   qty next in the queue.  If so, adjust the qty total by the amount
-        #   of the qty of the position next in the queue, remove that entry
-        #   from the queue and recurse the remove_from call with the amount
-        #   of the difference between the indicated amount and the queue
-        #   entry amount.
-        elif -position.qty > idx_qty:
-
-            remaining = position.qty + idx_qty
-            self.qty -= idx_qty
-            del self.positions[pos_idx]
-            
-            share_ratio = remaining/position.qty
-            position.qty = remaining
+            # Test scenarios for position removal
+            #   First scenario: indicated qty is the same as the position entry
+            #   qty next in the queue.  If so, simply adjust the qty total and 
+            #   remove that entry in the queue.
+            if -position.qty == idx_qty:
+                # Assume an opposite signed qty.
+                self._realize(idx_pos, position, idx_qty, idx_pos.fee,
+                              position.fee)
+                self.qty += position.qty
+                self.lots.remove(idx_pos)
+                break
+                
+            # Second scenario: indicated qty is greater than the position entry
+            #   qty next in the queue.  If so, adjust the qty total by the amount
+            #   of the qty of the position next in the queue, remove that entry
+            #   from the queue and carry on with the amount of the difference
+            #   between the indicated amount and the queue entry amount.
+            elif -position.qty > idx_qty:
+    
+                remaining = position.qty + idx_qty
+                
+                # prorate the fees, keeping the share of the remaining qty
+                share_ratio = float(remaining)/position.qty
+                fee = position.fee - share_ratio*position.fee
+                self._realize(idx_pos, position, idx_qty, idx_pos.fee, fee)
+                
+                self.qty -= idx_qty
+                self.lots.remove(idx_pos)
+                
+                position.qty = remaining
+                position.fee = position.fee - fee
+                if not self.lots:
+                    raise KeyError("No positions in Holding to remove")
             
-            # prorate the fees
-            position.fee = position.fee - share_ratio*position.fee
-            self.remove_from(position)
-        
-        # Third scenario: indicated qty is less than the position entry
-        #   qty next in the queue.  If so, adjust the queued qty and the
-        #   holdings qty, as well as prorating the remaining queued fees.
-        elif -position.qty < idx_qty:
-            remaining = idx_qty + position.qty
-            self.qty += position.qty  
-            # alter the 'indexed' position to reflect fee and qty changes
-            self.positions[pos_idx].qty = remaining
-            share_ratio = remaining/idx_qty
-            self.positions[pos_idx].fee = self.positions[pos_idx].fee * share_ratio
+            # Third scenario: indicated qty is less than the position entry
+            #   qty next in the queue.  If so, adjust the queued qty and the
+            #   holdings qty, as well as prorating the remaining queued fees.
+            else:
+                remaining = idx_qty + position.qty
+                share_ratio = float(remaining)/idx_qty
+                fee = idx_pos.fee - idx_pos.fee * share_ratio
+                self._realize(idx_pos, position, -position.qty, fee,
+                              position.fee)
+                
+                self.qty += position.qty  
+                # alter the 'indexed' position to reflect fee and qty changes
+                idx_pos.qty = remaining
+                idx_pos.fee = idx_pos.fee * share_ratio
+                break
         return
         
     def __repr__(self):
         """ Custom representation of holding object. """
         symbol = "No Holding"
-	if hasattr(self, "positions"):
-            if self.positions:
-                symbol = self.positions[0].symbol
+        positions = self.positions
+        if positions:
+            symbol = positions[0].symbol
         
-        return "<%s, qty: %s as %s>" % (symbol, self.qty, self.positions)
+        return "<%s, qty: %s as %s>" % (symbol, self.qty, positions)
     
     
-    def transact(self, symbol, cost, proceeds, fees):
-        """ posts transaction entry based on costs and proceeds """
+    def _realize(self, lot, position, qty, lot_fee, position_fee):
+        """ Posts the gain from closing qty of lot with position; the fees
+            are the shares of each one's fee that go with qty.
+        """
         
-        raise NotImplementedError
+        # A short lot is bought back: its own price is the proceeds
+        opening = lot.price*lot.multiplier
+        closing = position.price*position.multiplier
+        if lot.qty < 0:
+            opening, closing = closing, opening
+        self.transact(self.symbol, abs(qty)*opening, abs(qty)*closing,
+                      lot_fee + position_fee, open_id=lot.id,
+                      close_id=position.id, qty=qty,
+                      holding_period=(position.sort_key -
+                                      lot.sort_key)/1e6)
+    
+    def transact(self, symbol, cost, proceeds, fees, open_id="", close_id="",
+                 qty=0.0, holding_period=0.0):
+        """ posts transaction entry based on costs and proceeds """
         
+        self.journal.post(symbol, open_id, close_id, qty, cost, proceeds,
+                          fees, holding_period)
+        return
         
+
 if __name__ == '__main__':
     main()
 
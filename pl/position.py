@@ -11,24 +11,52 @@ License: BSD
 """
 
 # Standard library imports
-from datetime import datetime
+from datetime import date, datetime
 
 # Major package imports
+import numpy as np
 import pandas
 
 # Local library imports
 from date_util import dt_to_timestamp, dt_from_timestamp, Eastern
 
 
-class Position():
+# Layout of a position as a record of a structured array (see
+#   positions_to_array); trans_date is in seconds since the Epoch.
+position_dtype = np.dtype([("side", "S10"),
+                           ("symbol", "S50"),
+                           ("id", "S32"),
+                           ("description", "S100"),
+                           ("trans_date", "f8"),
+                           ("qty", "f8"),
+                           ("price", "f8"),
+                           ("multiplier", "f8"),
+                           ("fee", "f8"),
+                           ("exchange_rate", "f8"),
+                           ("currency", "S3"),
+                           ("total_amt", "f8")])
+
+
+class Position(object):
     """ Simple object to act as a data structure for a position 
     
         While all attributes are optional, classes that contain or
         collect instances of the Position class will require the following:
         symbol, trans_date, qty, price, total_amt
     
+        The attributes are slots, so a position carries no instance
+        dictionary; large books can also be held as one structured array
+        with positions_to_array.
+    
+        Positions order by sort_key, trans_date in integer microseconds,
+        worked out once when the position is created; trans_date is
+        read-only so the two can't disagree.  Positions on the same date
+        are left in the order they were added (see lot_queue).
     """
     
+    __slots__ = tuple(name for name in position_dtype.names
+                      if name != "trans_date") + ("_trans_date", "sort_key")
+    
     def __init__(self, symbol, id, trans_date, qty, price, description="",
                     side="BUY", multiplier=1.0, fee=0.0, exchange_rate=1.0,
                     currency="USD", total_amt=0.0, filled=True, exchange=""):
@@ -37,7 +65,7 @@ class Position():
         self.symbol = symbol
         self.id = id
         self.description = description
-        self.trans_date = trans_date
+        self._trans_date = trans_date
         self.qty = qty
         self.price = price
         self.multiplier = multiplier
@@ -45,6 +73,11 @@ class Position():
         self.exchange_rate = exchange_rate
         self.currency = currency
         self.total_amt = total_amt
+        self.sort_key = make_sort_key(trans_date)
+    
+    @property
+    def trans_date(self):
+        return self._trans_date
     
     ################################
     # Override default class methods
@@ -54,11 +87,53 @@ class Position():
         return "<Position %s %s>" % (self.symbol, self.qty)
     
     # support reasonable sorting based on trans_date
-    def __cmp__(self, other):
-        if self.trans_date < other.trans_date:
-            return -1
-        elif self.trans_date > other.trans_date:
-            return 1
-        else: return 0
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
+
+
+
+def positions_to_array(positions):
+    """ Returns the positions as a structured array of position_dtype.
+        Sort it by date with records.argsort(order='trans_date') rather than
+        sorting the Position objects.
+    """
+    
+    records = np.empty(len(positions), position_dtype)
+    for name in position_dtype.names:
+        values = [getattr(position, name) for position in positions]
+        if name == "trans_date":
+            values = [_seconds(value) for value in values]
+        elif position_dtype[name].kind == "S":
+            values = [str(value) for value in values]
+        records[name] = values
+    return records
+
+def positions_from_array(records):
+    """ Returns a list of Positions for the records of a structured array
+        of position_dtype.
+    """
+    
+    names = position_dtype.names
+    return [Position(**dict(zip(names, record))) for record in records.tolist()]
+
+def make_sort_key(trans_date):
+    """ Returns trans_date as the int microseconds since the Epoch that
+        positions are ordered by.
+    """
+    return int(round(_seconds(trans_date)*1e6))
+
+def _seconds(trans_date):
+    """ trans_date as seconds since the Epoch.  It may be a number of
+        seconds, or a datetime, date, numpy datetime64 or date string (which
+        like naive datetimes are taken as US/Eastern, see dt_to_timestamp).
+    """
+    if isinstance(trans_date, datetime):
+        return dt_to_timestamp(trans_date)
+    elif isinstance(trans_date, date):
+        return dt_to_timestamp(datetime(trans_date.year, trans_date.month,
+                                        trans_date.day))
+    elif isinstance(trans_date, (basestring, np.datetime64)):
+        return dt_to_timestamp(pandas.Timestamp(trans_date).to_pydatetime())
+    return float(trans_date)
 
 #### EOF ####################################################################
\ No newline at end of file
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+journal_test.py
+
+Copyright (c) 2012 Vaught Consulting.
+
+License: BSD
+
+"""
+
+# Major package imports
+import numpy as np
+
+# Local imports
+import journal
+
+
+def journal_grow_test():
+    """ Posting past the preallocated capacity keeps every record. """
+    j = journal.Journal(capacity=2)
+    for i in range(5):
+        j.post("AAPL", str(i), "99", 10.0, 100.0*i, 110.0*i, 1.0, 86400.0)
+    
+    records = j.to_array()
+    assert len(j)==5
+    assert records.dtype==journal.journal_dtype
+    assert list(records['open_id'])==["0", "1", "2", "3", "4"]
+    assert np.allclose(j.pnl, [10.0*i - 1.0 for i in range(5)])
+
+def journal_extend_test():
+    """ Records of one journal can be appended to another. """
+    j1 = journal.Journal(capacity=1)
+    j1.post("AAPL", "1", "2", 5.0, 50.0, 60.0, 0.0, 0.0)
+    j2 = journal.Journal()
+    j2.post("GOOG", "3", "4", -5.0, 40.0, 30.0, 0.0, 0.0)
+    j2.post("GOOG", "5", "6", 1.0, 10.0, 12.0, 0.0, 0.0)
+    
+    j1.extend(j2)
+    
+    assert list(j1['symbol'])==["AAPL", "GOOG", "GOOG"]
+    assert list(j1['qty'])==[5.0, -5.0, 1.0]
+
+#### EOF ####################################################################
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+ledger_test.py
+
+Copyright (c) 2012 Vaught Consulting.
+
+License: BSD
+
+"""
+
+# Standard library imports
+import collections
+
+# Major package imports
+import numpy as np
+import pandas
+
+# Local imports
+import ledger
+
+
+def make_trades(rows):
+    """ Builds a trades table from (symbol, id, date, qty, price, fee) """
+    symbol, id, date, qty, price, fee = zip(*rows)
+    qty = np.array(qty, float)
+    price = np.array(price, float)
+    return pandas.DataFrame({"symbol": symbol, "id": id,
+                             "date": pandas.to_datetime(date),
+                             "qty": qty, "price": price,
+                             "gross": np.abs(qty)*price, "fee": fee},
+                            columns=ledger.TRADE_COLUMNS)
+
+def ledger_fifo_test():
+    """ A sale spanning two buys closes the oldest lot first. """
+    trades = make_trades([
+        ("AAPL", "1", "2012-01-03", 1000, 185.25, 7.0),
+        ("AAPL", "2", "2012-02-01", 1500, 184.00, 7.0),
+        ("AAPL", "3", "2012-03-01", -1500, 186.00, 6.0)])
+
+    realized, open_lots = ledger.match_lots(trades, order="fifo")
+
+    assert list(realized["open_id"])==["1", "2"]
+    assert list(realized["qty"])==[1000, 500]
+    assert np.allclose(realized["cost_basis"], [185250., 92000.])
+    assert np.allclose(realized["proceeds"], [186000., 93000.])
+    assert np.allclose(realized["fees"], [7.0 + 4.0, 7.0/3 + 2.0])
+    assert np.allclose(realized["pnl"], realized["proceeds"] -
+                       realized["cost_basis"] - realized["fees"])
+    assert list(open_lots["id"])==["2"]
+    assert list(open_lots["qty"])==[1000]
+    assert np.allclose(open_lots["fees"], [7.0*2/3])
+
+def ledger_lifo_test():
+    """ The same trades matched lifo leave the first lot open. """
+    trades = make_trades([
+        ("AAPL", "1", "2012-01-03", 1000, 185.25, 7.0),
+        ("AAPL", "2", "2012-02-01", 1500, 184.00, 7.0),
+        ("AAPL", "3", "2012-03-01", -2000, 186.00, 7.0)])
+
+    realized, open_lots = ledger.match_lots(trades, order="lifo")
+
+    assert list(realized["open_id"])==["2", "1"]
+    assert list(realized["qty"])==[1500, 500]
+    assert list(open_lots["id"])==["1"]
+    assert list(open_lots["qty"])==[500]
+
+def ledger_short_test():
+    """ A sale with nothing held opens a short lot, which a later buy
+        closes, and a sale through zero leaves the rest short.
+    """
+    trades = make_trades([
+        ("SPY", "2", "2012-02-01", 10, 1.00, 0.0),
+        ("SPY", "1", "2012-01-03", -10, 1.25, 0.0),
+        ("GLD", "3", "2012-01-03", 100, 150.0, 0.0),
+        ("GLD", "4", "2012-01-04", -150, 151.0, 0.0)])
+
+    realized, open_lots = ledger.match_lots(trades)
+
+    spy = realized[realized["symbol"]=="SPY"]
+    assert list(spy["open_id"])==["1"]
+    assert list(spy["close_id"])==["2"]
+    assert list(spy["qty"])==[-10]
+    assert np.allclose(spy["pnl"], [2.5])
+    assert list(open_lots["id"])==["4"]
+    assert list(open_lots["qty"])==[-50]
+
+def ledger_fifo_matches_queue_test():
+    """ The array matching agrees with matching trade by trade. """
+    rng = np.random.RandomState(7)
+    rows = []
+    for i in range(400):
+        rows.append(("S%d" % rng.randint(5), str(i),
+                     "2012-01-%02d" % rng.randint(1, 29),
+                     rng.randint(-50, 60), 10.0 + rng.rand(), 1.0))
+    trades = make_trades(rows)
+
+    realized, open_lots = ledger.match_lots(trades, order="fifo")
+
+    expected = []
+    held = collections.defaultdict(collections.deque)
+    ordered = trades.iloc[np.lexsort((np.arange(len(trades)),
+                                      trades["date"].values))]
+    for _, trade in ordered.iterrows():
+        lots = held[trade["symbol"]]
+        qty = trade["qty"]
+        while qty and lots and (lots[0][1] > 0) != (qty > 0):
+            matched = min(abs(qty), abs(lots[0][1]))
+            expected.append((lots[0][0], trade["id"], matched))
+            lots[0][1] -= np.sign(lots[0][1])*matched
+            qty -= np.sign(qty)*matched
+            if not lots[0][1]:
+                lots.popleft()
+        if qty:
+            lots.append([trade["id"], qty])
+
+    assert sorted(expected)==sorted(zip(realized["open_id"],
+                                        realized["close_id"],
+                                        np.abs(realized["qty"])))
+    remaining = sorted((lot[0], lot[1]) for lots in held.values()
+                       for lot in lots)
+    assert remaining==sorted(zip(open_lots["id"], open_lots["qty"]))
+
+
+#### EOF ####################################################################
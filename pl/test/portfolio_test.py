@@ -10,9 +10,13 @@ License: BSD
 
 """
 
+# Standard library imports
+from datetime import datetime
+
 # Local imports
 import position
 import portfolio
+from date_util import dt_to_timestamp
 
 def portfolio_holding_test():
     """ Simple test to add position to holdings. """
@@ -154,6 +158,142 @@ def portfolio_holding_lifo2_test():
     assert p.price==185.25
     
 
+def portfolio_holding_wifo_test():
+    """ test of 'wifo' queuing, taking the highest priced lots first,
+        across several lots in one removal.
+    """
+    h = portfolio.Holding()
+    for i, price in enumerate([185.25, 190.00, 184.00, 188.50]):
+        h.add_to(position.Position(symbol="AAPL", id="13%s" % i, qty=100,
+                                   price=price, fee=7.0,
+                                   trans_date=1053605468.54 + i))
+    
+    h.remove_from(position.Position(symbol="AAPL", id="1399", qty=-250,
+                                    price=186.00, fee=7.0,
+                                    trans_date=1055902486.22), order='wifo')
+    
+    assert h.qty==150
+    assert [p.price for p in h.positions]==[185.25, 184.00]
+    assert [p.qty for p in h.positions]==[50, 100]
+    
+
+def portfolio_holding_key_order_test():
+    """ A key function orders one removal, building its heap once, and is
+        dropped by the queue on the next add.
+    """
+    h = portfolio.Holding()
+    for id, price in [("1", 185.25), ("2", 184.00), ("3", 186.50),
+                      ("4", 183.75)]:
+        h.add_to(position.Position(symbol="AAPL", id=id, qty=100,
+                                   price=price, trans_date=1053605468.54))
+
+    calls = []
+    def cheapest(p, seq):
+        calls.append(p.id)
+        return (p.price, seq)
+
+    h.remove_from(position.Position(symbol="AAPL", id="5", qty=-250,
+                                    price=186.00, trans_date=1055902486.22),
+                  order=cheapest)
+
+    assert [p.id for p in h.positions]==["1", "3"]
+    assert [p.qty for p in h.positions]==[50, 100]
+    assert sorted(calls)==["1", "2", "3", "4"]
+    assert h.lots._heaps == {}
+
+    h.add_to(position.Position(symbol="AAPL", id="6", qty=100,
+                               price=185.00, trans_date=1055902486.22))
+    assert h.lots._key_heap is None
+    h.remove_from(position.Position(symbol="AAPL", id="7", qty=-10,
+                                    price=186.00, trans_date=1055902486.22),
+                  order='lifo')
+    assert h.lots._heaps.keys() == ['lifo']
+
+
+def portfolio_holding_many_lots_test():
+    """ A large removal against many small lots is matched without
+        recursion.
+    """
+    h = portfolio.Holding()
+    for i in range(5000):
+        h.add_to(position.Position(symbol="AAPL", id=str(i), qty=1.0,
+                                   price=10.0, trans_date=1000000000.0 + i))
+    
+    h.remove_from(position.Position(symbol="AAPL", id="sell", qty=-4999.0,
+                                    price=11.0, trans_date=2000000000.0),
+                  order='lifo')
+    
+    assert h.qty==1.0
+    assert [p.id for p in h.positions]==["0"]
+    
+
+def portfolio_holding_order_test():
+    """ Lots added out of date order are kept in sort_key order, with
+        ties on trans_date in the order added.
+    """
+    h = portfolio.Holding()
+    for id, date in [("9", 1053605468.54), ("2", 1021236990.02),
+                     ("10", 1053605468.54), ("4", 1045623459.68)]:
+        h.add_to(position.Position(symbol="AAPL", id=id, qty=100,
+                                   price=185.25, trans_date=date))
+    
+    assert [p.id for p in h.positions]==["2", "4", "9", "10"]
+    
+    h.remove_from(position.Position(symbol="AAPL", id="5", qty=-150,
+                                    price=186.00, trans_date=1055902486.22),
+                  order='fifo')
+    
+    assert [p.id for p in h.positions]==["4", "9", "10"]
+    assert h.positions[0].qty==50
+    
+    h.remove_from(position.Position(symbol="AAPL", id="6", qty=-100,
+                                    price=186.00, trans_date=1055902486.22),
+                  order='lifo')
+    
+    assert [p.id for p in h.positions]==["4", "9"]
+    
+
+def portfolio_holding_journal_test():
+    """ A removal spanning two lots posts a journal record per lot, with
+        both positions' fees prorated by shares.
+    """
+    p1 = position.Position(symbol="AAPL", id="1250", qty=1000, price=185.25,
+                          fee=7.0, trans_date=1053605468.54)
+    p2 = position.Position(symbol="AAPL", id="1251", qty=1500, price=184.00,
+                          fee=6.0, trans_date=1054202245.63)
+    p3 = position.Position(symbol="AAPL", id="1252", qty=-1500, price=186.00,
+                          fee=9.0, trans_date=1055902486.22)
+    
+    portf = portfolio.Portfolio(name="Test Portfolio")
+    h = portfolio.Holding()
+    h.add_to(p1)
+    h.add_to(p2)
+    portf.add_holding(h)
+    
+    h.remove_from(p3, order='fifo')
+    
+    records = portf.journal.to_array()
+    assert list(records['open_id'])==["1250", "1251"]
+    assert list(records['close_id'])==["1252", "1252"]
+    assert list(records['qty'])==[1000, 500]
+    assert list(records['cost_basis'])==[185250., 92000.]
+    assert list(records['proceeds'])==[186000., 93000.]
+    assert abs(records['fees'][0] - (7.0 + 6.0)) < 1e-9
+    assert abs(records['fees'][1] - (2.0 + 3.0)) < 1e-9
+    assert abs(records['holding_period'][0] - (1055902486.22 - 1053605468.54)) < 1e-6
+    # the open lot keeps the rest of its fee
+    assert h.positions[0].fee==4.0
+    
+    # holding periods come from dates of any type
+    h.remove_from(position.Position(symbol="AAPL", id="1253", qty=-100,
+                                    price=186.00,
+                                    trans_date=datetime(2003, 6, 18, 12)),
+                  order='fifo')
+    assert abs(portf.journal["holding_period"][-1] -
+               (dt_to_timestamp(datetime(2003, 6, 18, 12)) -
+                1054202245.63)) < 1e-6
+    
+
 def portfolio_port_test():
     """ test of 'lifo' queuing by adding and removing
         a position.
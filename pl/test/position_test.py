@@ -10,6 +10,9 @@ License: BSD
 
 """
 
+from datetime import date, datetime
+
+import numpy as np
 
 import position
 
@@ -45,6 +48,25 @@ def position_dates_test():
     pass
 
 
+def position_date_types_test():
+    """ trans_date may be seconds, or any of the usual date types. """
+    dates = [datetime(2003, 5, 22), date(2003, 5, 22), "2003-05-22",
+             np.datetime64("2003-05-22")]
+    keys = [position.Position(symbol="AAPL", id=str(i), qty=1000,
+                              price=185.25, trans_date=trans_date).sort_key
+            for i, trans_date in enumerate(dates)]
+    
+    assert len(set(keys))==1
+    seconds = position.dt_to_timestamp(datetime(2003, 5, 22))
+    p = position.Position(symbol="AAPL", id="1", qty=1000, price=185.25,
+                          trans_date=seconds)
+    assert p.sort_key==keys[0]
+    
+    earlier = position.Position(symbol="AAPL", id="2", qty=1000,
+                                price=185.25, trans_date="2003-05-21 16:00")
+    assert earlier < p
+
+
 def position_sort_test():
     """ Test to see if I can collect and sort these properly.
         The objective is to have the objects sort by the trans_date
@@ -74,4 +96,54 @@ def position_sort_test():
     
     
     
+def position_slots_test():
+    """ Positions have no instance dictionary to grow. """
+    p = position.Position(symbol="AAPL", id="1226", qty=1000, price=185.25,
+                          trans_date=1053605468.54)
+    
+    assert not hasattr(p, "__dict__")
+    try:
+        p.note = "not an attribute"
+    except AttributeError:
+        pass
+    else:
+        assert False, "set an attribute that is not a slot"
+
+
+def position_trans_date_test():
+    """ trans_date is read-only, so it always agrees with sort_key. """
+    p = position.Position(symbol="AAPL", id="1226", qty=1000, price=185.25,
+                          trans_date=1053605468.54)
+    
+    assert p.sort_key==1053605468540000
+    try:
+        p.trans_date = 1021236990.02
+    except AttributeError:
+        pass
+    else:
+        assert False, "changed trans_date"
+    assert p.trans_date==1053605468.54
+
+
+def position_array_test():
+    """ Positions round trip through a structured array, which sorts by
+        trans_date without comparing Position objects.
+    """
+    plist = [position.Position(symbol="AAPL", id=str(1230 + i), qty=100*i,
+                               price=185.25, fee=7.0, trans_date=date)
+             for i, date in enumerate([1045623459.68, 1053605468.54,
+                                       1021236990.02])]
+    
+    records = position.positions_to_array(plist)
+    order = records.argsort(order='trans_date')
+    
+    assert records.dtype==position.position_dtype
+    assert list(records['id'][order])==["1232", "1230", "1231"]
+    
+    copies = position.positions_from_array(records)
+    assert [p.id for p in copies]==["1230", "1231", "1232"]
+    assert [p.qty for p in copies]==[0.0, 100.0, 200.0]
+    assert copies[2].trans_date==1021236990.02
+    
+    
 #### EOF ####################################################################
\ No newline at end of file
@@ -28,6 +28,7 @@ from chaco.tools.api import PanTool, ZoomTool, DataLabelTool, ScatterInspector
 
 # Local imports
 from data_point_label import DataPointLabel
+from frontier import efficient_frontier
 from metrics import TRADING_DAYS_PER_YEAR
 import mpt
 import price_utils
@@ -253,28 +254,15 @@ class PortfolioModel(HasTraits):
         tdy = TRADING_DAYS_PER_YEAR
         rtrange = np.arange(rt0/tdy, rtn/tdy, rtstep/tdy)
 
-        efx = []
-        efy = []
-        allocations = {}
-        
-        p = self.portfolio
-    
-        for rt in rtrange:
-            p.optimize_portfolio(rt=rt, lower_bound_weight=0.1, upper_bound_weight=1.0)
-            px = p.port_opt.volatility
-            py = p.port_opt.portfolio_return
-            efx.append(px)
-            efy.append(py)
-            # convert to annual returns in %
-            allocations[round(rt * 100, 2)] = p.port_opt.weights
-
-            # reset the optimization
-            p.port_opt = None
+        efx, efy, allocations = efficient_frontier(self.portfolio, rtrange,
+                                                   lower_bound_weight=0.1,
+                                                   upper_bound_weight=1.0)
 
         # cache the results
         self.efx = efx
         self.efy = efy
         self.allocations = allocations
+        self.rtrange = rtrange
 
         return efx, efy, allocations
 
@@ -369,15 +357,14 @@ class PortfolioModel(HasTraits):
         else:
             a = self.allocations
 
-        rts = a.keys()
-        rts.sort()
-        rts = np.array(rts)
+        # One allocation per risk tolerance (in %)
+        rts = self.rtrange * 100
 
-        symbs = a[rts[0]].keys()
+        symbs = a[0].keys()
         symbs.sort()
 
         # "Transpose" symbols' weights to get vectors of weights for each symbol
-        symb_data = np.array([[a[rt][symb] for rt in rts] for symb in symbs])
+        symb_data = np.array([[weights[symb] for weights in a] for symb in symbs])
 
         self.symbols2 = [Symbol(symbol=symbs[i], color=COLORS[i]) for i in range(len(symbs))]
 
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+frontier.py
+
+Efficient frontier sweeps over a grid of risk tolerances.  Each point is an
+independent bounded mean-variance solve (mpt.solve_mean_variance) on the
+portfolio's expected returns and covariance, so the grid is spread across
+a pool of worker processes.  The workers see the arrays through shared
+memory handed over when the pool starts, rather than a pickled copy for
+each point.
+
+Alternatively trace_frontier walks the grid in order, starting each solve
+from the weights of the point before, and can fill in extra points where
+the allocations change quickly.
+
+Copyright (c) 2011 Vaught Management, LLC.
+License: BSD
+"""
+
+# Standard library imports ####
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+
+# Major library imports ####
+import numpy as np
+
+# Local imports ####
+from metrics import TRADING_DAYS_PER_YEAR
+from mpt import solve_mean_variance
+
+# Fewer points than this per process aren't worth starting a pool for
+MIN_POINTS_PER_PROCESS = 4
+
+# Arrays shared with the worker processes, set up by _init_worker
+_shared = {}
+
+
+def frontier_point(e, C, rt, lower_bound_weight, upper_bound_weight,
+                   x0=None, nobs=None):
+    """ Optimal weights for one risk tolerance, starting the search from
+        x0 if given.
+        Returns:
+            (weights array, annual volatility, portfolio return, iterations)
+        The volatility matches metrics.volatility of the portfolio rates
+        when nobs, the number of rates C was estimated from, is given.
+    """
+
+    x, count = solve_mean_variance(e, C, rt, lower_bound_weight,
+                                   upper_bound_weight, x0)
+    variance = np.dot(x, np.dot(C, x))
+    if nobs:
+        # np.cov divides by n-1, metrics.volatility by n
+        variance *= (nobs - 1.0)/nobs
+    vol = np.sqrt(TRADING_DAYS_PER_YEAR*max(variance, 0.0))
+    return x, vol, np.dot(e, x), count
+
+
+def feasible_bounds(n, lower_bound_weight, upper_bound_weight):
+    """ Returns the weight bounds loosened just enough that n equal weights
+        meet them: a lower bound of 0.1 can't be met by more than 10
+        weights summing to 1.0, nor an upper bound of 0.1 by fewer.
+    """
+    return (np.minimum(lower_bound_weight, 1.0/n),
+            np.maximum(upper_bound_weight, 1.0/n))
+
+
+def _init_worker(e, C, x0, n, nobs):
+    _shared['e'] = np.frombuffer(e)
+    _shared['C'] = np.frombuffer(C).reshape(n, n)
+    _shared['x0'] = np.frombuffer(x0)
+    _shared['nobs'] = nobs
+
+
+def _solve_shared(args):
+    rt, lower_bound_weight, upper_bound_weight = args
+    x, vol, ret, count = frontier_point(_shared['e'], _shared['C'], rt,
+                                        lower_bound_weight,
+                                        upper_bound_weight, _shared['x0'],
+                                        _shared['nobs'])
+    return x.tolist(), vol, ret, count
+
+
+def _shared_copy(array):
+    array = np.ascontiguousarray(array, dtype=float)
+    shared = RawArray('d', array.size)
+    np.frombuffer(shared)[:] = array.ravel()
+    return shared
+
+
+def efficient_frontier(portfolio, rtrange, lower_bound_weight=-0.50,
+                       upper_bound_weight=1.5, processes=None, mode="pool",
+                       max_change=None):
+    """ Sweeps the efficient frontier of portfolio over rtrange.
+
+        Parameters:
+            portfolio: mpt.Portfolio
+            rtrange: sequence of (daily) risk tolerances
+            lower_bound_weight, upper_bound_weight: bounds on the weights,
+                loosened to 1/n if n weights can't meet them (see
+                feasible_bounds)
+            processes: number of worker processes, by default one per cpu.
+                Small grids are solved in this process.
+            mode: "pool" to solve the points in parallel, or "trace" to
+                solve them in order with trace_frontier
+            max_change: for "trace", see trace_frontier
+
+        Returns:
+            efx: list of annual volatilities, one per rt
+            efy: list of portfolio returns, one per rt
+            allocations: list of dicts of symbol weights, one per rt
+    """
+
+    if mode == "trace":
+        return trace_frontier(portfolio, rtrange, lower_bound_weight,
+                              upper_bound_weight, max_change)
+    elif mode != "pool":
+        raise ValueError("Unknown frontier mode: %s" % mode)
+
+    symbols = portfolio.symbols
+    lower_bound_weight, upper_bound_weight = feasible_bounds(
+        len(symbols), lower_bound_weight, upper_bound_weight)
+    e = portfolio.expected_returns
+    C = portfolio.covariance
+    nobs = portfolio.rates.shape[1]
+    x0 = np.array([portfolio.weights[symbol] for symbol in symbols])
+    rtrange = [float(rt) for rt in rtrange]
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(rtrange) // MIN_POINTS_PER_PROCESS)
+
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                    initargs=(_shared_copy(e), _shared_copy(C),
+                                              _shared_copy(x0), len(e), nobs))
+        try:
+            points = pool.map(_solve_shared,
+                              [(rt, lower_bound_weight, upper_bound_weight)
+                               for rt in rtrange])
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        points = [frontier_point(e, C, rt, lower_bound_weight,
+                                 upper_bound_weight, x0, nobs)
+                  for rt in rtrange]
+
+    return _frontier_lists(symbols, rtrange, points)
+
+
+def trace_frontier(portfolio, rtrange, lower_bound_weight=-0.50,
+                   upper_bound_weight=1.5, max_change=None, max_points=200):
+    """ Traces the efficient frontier of portfolio through rtrange in
+        increasing order, starting each solve from the previous optimum.
+
+        Parameters:
+            max_change: if given, risk tolerances are added halfway
+                between neighbouring points until no weight changes by
+                more than this from one point to the next
+            max_points: limit on the total number of points
+
+        Returns:
+            efx, efy and allocations as efficient_frontier does, in order
+            of increasing rt and including any points added.
+    """
+
+    symbols = portfolio.symbols
+    lower_bound_weight, upper_bound_weight = feasible_bounds(
+        len(symbols), lower_bound_weight, upper_bound_weight)
+    e = portfolio.expected_returns
+    C = portfolio.covariance
+    nobs = portfolio.rates.shape[1]
+    x = np.array([portfolio.weights[symbol] for symbol in symbols])
+
+    points = {}
+    for rt in sorted(float(rt) for rt in rtrange):
+        points[rt] = frontier_point(e, C, rt, lower_bound_weight,
+                                    upper_bound_weight, x, nobs)
+        x = points[rt][0]
+
+    if max_change is not None:
+        rts = sorted(points)
+        pending = zip(rts[:-1], rts[1:])
+        while pending and len(points) < max_points:
+            lo, hi = pending.pop()
+            change = np.abs(points[hi][0] - points[lo][0]).max()
+            mid = 0.5*(lo + hi)
+            if change <= max_change or mid in (lo, hi):
+                continue
+            points[mid] = frontier_point(e, C, mid, lower_bound_weight,
+                                         upper_bound_weight, points[lo][0],
+                                         nobs)
+            pending.extend([(lo, mid), (mid, hi)])
+
+    rts = sorted(points)
+    return _frontier_lists(symbols, rts, [points[rt] for rt in rts])
+
+
+def _frontier_lists(symbols, rts, points):
+    """ Gathers frontier_point results into efx, efy and allocations. """
+
+    efx = []
+    efy = []
+    allocations = []
+    for rt, (x, vol, ret, count) in zip(rts, points):
+        efx.append(vol)
+        efy.append(ret)
+        weights = np.asarray(x).tolist()
+        allocations.append(dict(zip(symbols, weights)))
+
+    return efx, efy, allocations
+
+
+# EOF ####################################################################
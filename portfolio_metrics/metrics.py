@@ -120,7 +120,7 @@ def chain_linked_return(ratearray):
     return prod(1.0 + ratearray['rate']) - 1.0
     
     
-def expected_return(ratearray, bench_ratearray, rfr=0.0):
+def expected_return(ratearray, bench_ratearray, rfr=0.0, betai=None):
     """ Calculate the expected return using the Capital Asset
         Pricing Model (CAPM) approach.
         
@@ -135,9 +135,12 @@ def expected_return(ratearray, bench_ratearray, rfr=0.0):
             E(Rm) is the expected return of the market, which, rather than
                 using the geometric mean as advised, we do the brute force
                 calculation of the annualized_adjusted_rate for the benchmark.
+        
+        betai may be passed in when beta_bb has already been calculated.
     """
     
-    betai = beta_bb(ratearray, bench_ratearray)
+    if betai is None:
+        betai = beta_bb(ratearray, bench_ratearray)
     erm = annualized_adjusted_rate(bench_ratearray, rfr)
     eri = rfr + betai*(erm-rfr)
     
@@ -157,23 +160,157 @@ def rate_array(pricearray, startprice=None, priceused='adjclose'):
            one of {'open', 'high', 'low', 'close', 'adjclose'}
            
     """   
-    if startprice:
-        opn = startprice
+    dt_rates = np.dtype({'names':['date', 'rate'],
+                        'formats':[pricearray.dtype['date'], float]})
+
+    rates = np.empty(len(pricearray), dtype=dt_rates)
+    rates['date'] = pricearray['date']
+    if len(pricearray):
+        prices = np.asarray(pricearray[priceused], dtype=float)
+        rates['rate'] = rate_matrix(prices[np.newaxis, :], startprice)[0]
+
+    return rates
+
+
+def rate_matrix(pricematrix, startprice=None):
+    """ Converts a 2-D array of prices into simple return rates in one pass.
+    
+        Parameters:
+        -----------
+         - pricematrix: array
+           N x T float array, one row of prices per symbol
+         - startprice: float or 1d array of floats
+           open price(s), if not provided first day close will be used
+           
+        Returns:
+         - N x T float array of periodic rates, the first column being the
+           rate from startprice to the first price
+    """
+    
+    prices = np.asarray(pricematrix, dtype=float)
+    if prices.ndim == 1:
+        prices = prices[np.newaxis, :]
+    
+    rates = np.empty(prices.shape, dtype=float)
+    if prices.shape[1] == 0:
+        return rates
+    
+    if startprice is None or (np.isscalar(startprice) and not startprice):
+        opn = prices[:, 0]
     else:
-        opn = pricearray[priceused][0]
-        
-    rates = []
+        opn = np.asarray(startprice, dtype=float) * np.ones(prices.shape[0])
     
-    for price in pricearray:
-        rates.append((price['date'], (price[priceused]/opn)-1 ))
-        opn = price[priceused]
-        
-    dt_rates = np.dtype({'names':['date', 'rate'],
-                        'formats':['M8', float]})
+    rates[:, 0] = prices[:, 0]/opn - 1
+    rates[:, 1:] = prices[:, 1:]/prices[:, :-1] - 1
     
-    return np.array(rates, dtype=dt_rates)
+    return rates
 
 
+def regress_matrix(ratematrix, bench_rates):
+    """ Regresses many series of rates against the benchmark in one pass,
+        instead of a polyfit per series.
+        
+        Parameters:
+         - ratematrix: array
+           N x T float array, one row of rates per symbol (see rate_matrix)
+         - bench_rates: array
+           1d float array of the T benchmark rates
+        Returns:
+         - record array of N ('beta', 'beta_bb', 'alpha', 'r2'), as beta,
+           beta_bb and alpha would return for each row, and the R squared
+           of each fit.
+    """
+    
+    rates = np.asarray(ratematrix, dtype=float)
+    if rates.ndim == 1:
+        rates = rates[np.newaxis, :]
+    bench = np.asarray(bench_rates, dtype=float)
+    
+    bdev = bench - bench.mean()
+    rmean = rates.mean(axis=1)
+    rdev = rates - rmean[:, np.newaxis]
+    
+    bvar = np.dot(bdev, bdev)
+    covar = np.dot(rdev, bdev)
+    rvar = (rdev*rdev).sum(axis=1)
+    
+    dt_regress = np.dtype({'names':['beta', 'beta_bb', 'alpha', 'r2'],
+                           'formats':[float, float, float, float]})
+    result = np.empty(len(rates), dtype=dt_regress)
+    result['beta'] = covar/bvar
+    result['beta_bb'] = 0.33 + 0.67*result['beta']
+    result['alpha'] = rmean - result['beta']*bench.mean()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['r2'] = covar*covar/(bvar*rvar)
+    return result
+    
+    
+def rolling_alpha(ratearray, bench_ratearray, window=TRADING_DAYS_PER_YEAR):
+    """ alpha over each trailing window of rates, see rolling_volatility """
+    
+    b, boffset = _centered(bench_ratearray['rate'])
+    r, roffset = _centered(ratearray['rate'])
+    sb, sr, sbb, sbr = _window_sums([b, r, b*b, b*r], window)
+    slope = _slope(sb, sr, sbb, sbr, window)
+    values = (sr - slope*sb)/window + roffset - slope*boffset
+    return _rolling_result(ratearray, values, window)
+    
+    
+def rolling_annualized_adjusted_rate(ratearray, rfr=0.0,
+                                     window=TRADING_DAYS_PER_YEAR):
+    """ annualized_adjusted_rate over each trailing window of rates, see
+        rolling_volatility.  rfr must be a float here.
+    """
+    
+    rates = np.asarray(ratearray['rate'], dtype=float)
+    values = _window_sums([rates], window)[0]/_window_years(ratearray, window)
+    return _rolling_result(ratearray, values - rfr, window)
+    
+    
+def rolling_beta(ratearray, bench_ratearray, window=TRADING_DAYS_PER_YEAR):
+    """ beta over each trailing window of rates, see rolling_volatility """
+    
+    b, boffset = _centered(bench_ratearray['rate'])
+    r, roffset = _centered(ratearray['rate'])
+    sb, sr, sbb, sbr = _window_sums([b, r, b*b, b*r], window)
+    values = _slope(sb, sr, sbb, sbr, window)
+    return _rolling_result(ratearray, values, window)
+    
+    
+def rolling_sharpe_ratio(ratearray, rfr=0.0, window=TRADING_DAYS_PER_YEAR):
+    """ sharpe_ratio over each trailing window of rates, see
+        rolling_volatility.  rfr must be a float here.
+    """
+    
+    rates = np.asarray(ratearray['rate'], dtype=float)
+    excess = _window_sums([rates], window)[0]/_window_years(ratearray, window)
+    sigma = _window_std(rates, window)
+    return _rolling_result(ratearray, (excess - rfr)/sigma, window)
+    
+    
+def rolling_volatility(ratearray, window=TRADING_DAYS_PER_YEAR, period="d"):
+    """ Calculates volatility over each trailing window of rates, in O(T)
+        from running sums rather than one call per window.
+        
+        Parameters:
+         - ratearray: recarray of "date" and "rate" data
+         - window: int
+           number of rates in each window, e.g. 63 for a quarter of
+           daily rates
+         - period: string
+           "m", "w" or "d", as for volatility
+        Returns:
+         - recarray of "date" and "value", aligned with ratearray; the
+           value at each date covers the window ending there, and is NaN
+           until there are window rates.
+    """
+    
+    periods = {"d":TRADING_DAYS_PER_YEAR, "w":WEEKS_PER_YEAR,
+               "m":MONTHS_PER_YEAR}[period]
+    values = sqrt(periods) * _window_std(ratearray['rate'], window)
+    return _rolling_result(ratearray, values, window)
+    
+    
 def sharpe_ratio(ratearray, rfr=0.0):
     """ Sharpe Ratio
         defined as:
@@ -215,6 +352,73 @@ def volatility(ratearray, period="d"):
     return sqrt(periods) * ratearray['rate'].std()
     
     
+def _centered(rates):
+    """ Returns the rates less their overall mean, and the mean.  Centering
+        keeps the running sums of squares from losing precision.
+    """
+    
+    rates = np.asarray(rates, dtype=float)
+    offset = rates.mean() if len(rates) else 0.0
+    return rates - offset, offset
+        
+        
+def _rolling_result(ratearray, values, window):
+    dt_values = np.dtype({'names':['date', 'value'],
+                          'formats':[ratearray.dtype['date'], float]})
+    result = np.empty(len(ratearray), dtype=dt_values)
+    result['date'] = ratearray['date']
+    result['value'] = np.nan
+    if len(values):
+        result['value'][int(window)-1:] = values
+    return result
+    
+    
+def _slope(sx, sy, sxx, sxy, n):
+    """ Least squares slope of y on x from window sums """
+    
+    return (sxy - sx*sy/n)/(sxx - sx*sx/n)
+    
+    
+def _window_std(rates, window):
+    """ Population standard deviation over each trailing window """
+    
+    rates, offset = _centered(rates)
+    s1, s2 = _window_sums([rates, rates*rates], window)
+    return sqrt(np.maximum(s2/window - (s1/window)**2, 0.0))
+    
+    
+def _window_sums(arrays, window):
+    """ Returns a list with the sums of each array over every trailing
+        window, len(array)-window+1 of them.
+    """
+    
+    window = int(window)
+    sums = []
+    for values in arrays:
+        values = np.asarray(values, dtype=float)
+        if window > len(values):
+            sums.append(np.empty(0))
+            continue
+        total = np.cumsum(values)
+        windowed = total[window-1:].copy()
+        windowed[1:] -= total[:-window]
+        sums.append(windowed)
+    return sums
+    
+    
+def _window_years(ratearray, window):
+    """ Length in years of each trailing window, measured by its dates as
+        annualized_adjusted_rate does.
+    """
+    
+    window = int(window)
+    dates = ratearray['date']
+    if window > len(dates):
+        return np.empty(0)
+    days = (dates[window-1:] - dates[:len(dates)-window+1]).astype('m8[D]')
+    return days.astype(float)/CALENDAR_DAYS_PER_YEAR
+    
+    
 # EOF ####################################################################
 
 
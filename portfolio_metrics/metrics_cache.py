@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+metrics_cache.py
+
+Cache of computed stock and portfolio metrics, so that rebuilding a Stock or
+Portfolio over unchanged data (e.g. reopening the MPT view) returns the
+results already computed instead of loading and recomputing everything.
+
+Entries are kept in memory with least recently used eviction, and
+optionally pickled to a directory as well so they outlive the process.
+Keys start with db_version(dbfilename), so anything saved to the
+database makes the old entries unreachable.  Values are shared by everyone
+who gets them, so their arrays are kept read-only (see read_only).
+
+Copyright (c) 2011 Vaught Management, LLC.
+License: BSD
+"""
+
+# Standard library imports
+import copy
+import cPickle
+import hashlib
+import os
+import shutil
+import sys
+import threading
+from collections import OrderedDict
+
+# Major package imports
+import numpy as np
+
+# Local imports
+from price_utils import price_db
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from ts_utils import write_atomically
+
+
+def db_version(dbfilename):
+    """ Returns a token identifying the current content of dbfilename: its
+        path and the (token, count) price_db.data_version of the file,
+        which every save to it bumps.
+    """
+
+    path = os.path.abspath(dbfilename)
+    if not os.path.exists(path):
+        return (path, None, None)
+    return (path,) + price_db.data_version(path)
+
+
+def read_only(value):
+    """ Returns value with the arrays in it read-only, looking into dicts,
+        lists, tuples and the attributes of objects.  Writable arrays are
+        copied first, so whoever else holds them can't change the result;
+        arrays already read-only are shared as they are.
+    """
+
+    if isinstance(value, np.ndarray):
+        if value.flags.writeable:
+            value = value.copy()
+            value.flags.writeable = False
+    elif isinstance(value, dict):
+        value = dict((name, read_only(item)) for name, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        value = type(value)(read_only(item) for item in value)
+    elif hasattr(value, "__dict__") and not isinstance(value, type):
+        value = copy.copy(value)
+        value.__dict__ = read_only(value.__dict__)
+    return value
+
+
+class MetricsCache(object):
+    """ LRU cache of metrics results, keyed by tuples such as
+
+            (db_version(dbfilename), symbol, startdate, enddate, priceused,
+             rfr, bench)
+
+        Parameters:
+        max_entries: number of entries kept in memory
+        cachedir: optional directory to also pickle entries to
+    """
+
+    def __init__(self, max_entries=256, cachedir=None):
+        self.max_entries = max_entries
+        self.cachedir = cachedir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """ Returns the value stored for key, or default. """
+
+        with self._lock:
+            if key in self._entries:
+                value = self._entries.pop(key)
+                self._entries[key] = value
+                return value
+
+        value = self._load(key)
+        if value is None:
+            return default
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        """ Stores value (which must be picklable for the disk tier). """
+
+        self._remember(key, value)
+        if self.cachedir is not None:
+            self._store(key, value)
+
+    def clear(self):
+        """ Empties the cache, including the disk tier. """
+
+        with self._lock:
+            self._entries.clear()
+        if self.cachedir is not None and os.path.isdir(self.cachedir):
+            shutil.rmtree(self.cachedir, ignore_errors=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries or (self.cachedir is not None and
+                                        os.path.exists(self._filename(key)))
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _filename(self, key):
+        digest = hashlib.sha1(repr(key)).hexdigest()
+        return os.path.join(self.cachedir, digest + ".pkl")
+
+    def _load(self, key):
+        if self.cachedir is None:
+            return None
+        try:
+            with open(self._filename(key), "rb") as f:
+                stored_key, value = cPickle.load(f)
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+            return None
+        # Guard against digest collisions
+        if stored_key != key:
+            return None
+        return read_only(value)
+
+    def _store(self, key, value):
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+        write_atomically(self._filename(key), lambda f: cPickle.dump(
+            (key, value), f, cPickle.HIGHEST_PROTOCOL))
+
+
+# Shared by Stock and Portfolio unless they are given another cache
+default_cache = MetricsCache()
+
+
+#### EOF ##################################################################
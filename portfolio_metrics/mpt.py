@@ -9,16 +9,17 @@ License: BSD
 """
 
 # Standard library imports ####
-import copy
+import itertools
+import uuid
 
 # Major library imports ####
 import numpy as np
-from scipy.interpolate import interp1d
 
 # Local imports ####
 from metrics import (annualized_adjusted_rate, beta_bb, 
-    expected_return, rate_array, volatility)
+    expected_return, rate_array, rate_matrix, regress_matrix, volatility)
 
+from metrics_cache import db_version, default_cache, read_only
 import price_utils
 
 # Constants ####
@@ -26,36 +27,246 @@ price_schema = np.dtype({'names':['symbol', 'date', 'open', 'high', 'low', 'clos
                          'formats':['S8', 'M8', float, float, float, float, float, float]})
 
 
-def align_dates(olddates, olddata, newdates):
+def align_dates(olddates, olddata, newdates, alignment=None):
     """ Function to align data given two differing date streams.
         Parameters:
             olddates: array of datetime64 type representing dates with misalignment
-            olddata: array floats representing data for olddates
+            olddata: array floats representing data for olddates, or a 2-D
+                array with one row of data per field
             newdates: array of datetime64 type representing new dates with which we should align.
+            alignment: optional DateAlignment precomputed for these dates
         Returns:
             newdata: array of data aligned with newdates
     """
 
-    olddatefloats = np.array([price_utils.adapt_datetime(dt) for dt in olddates.tolist()])
-    newdatefloats = np.array([price_utils.adapt_datetime(dt) for dt in newdates.tolist()])
-    datesbelow = newdatefloats < olddatefloats[0]
-    datesabove = newdatefloats > olddatefloats[-1]
-    dts = ~(datesabove | datesbelow)
+    if alignment is None:
+        alignment = date_alignment(olddates, newdates)
 
-    f = interp1d(olddatefloats, olddata)
+    return alignment(olddata)
 
-    newdata = f(newdatefloats[dts])
 
-    return newdata
+class DateAlignment(object):
+    """ Linear interpolation of data on one set of dates onto the new dates
+        which fall within their range.  The date-to-float mapping, bracketing
+        indices and weights are computed once, and then applied to any
+        number of fields at a time.
+    """
+
+    def __init__(self, olddates, newdates):
+        self.olddates = olddates
+        self.newdates = newdates
+
+        oldfloats = _date_floats(olddates)
+        newfloats = _date_floats(newdates)
+
+        # Only dates within the old range can be interpolated
+        self.mask = (newfloats >= oldfloats[0]) & (newfloats <= oldfloats[-1])
+        x = newfloats[self.mask]
+
+        hi = oldfloats.searchsorted(x, side='right').clip(1, len(oldfloats)-1)
+        lo = hi - 1
+        span = oldfloats[hi] - oldfloats[lo]
+        span[span==0] = 1.0
+
+        self.lo = lo
+        self.hi = hi
+        self.weight = ((x - oldfloats[lo])/span).clip(0.0, 1.0)
+
+    def __call__(self, data):
+        """ Interpolates data (1-D, or 2-D with dates along the last axis)
+            onto the new dates within range.
+        """
+        data = np.asarray(data, dtype=float)
+        lo = data[..., self.lo]
+        return lo + self.weight*(data[..., self.hi] - lo)
+
+    def matches(self, olddates, newdates):
+        """ Whether this alignment was built for the given dates. """
+        return (np.array_equal(self.olddates, olddates) and
+                np.array_equal(self.newdates, newdates))
+
+
+# Recently used alignments, most recent last.  Stocks in a portfolio are all
+#   imputed to the same dates against copies of the same benchmark, so the
+#   same alignment comes up repeatedly.
+_recent_alignments = []
+MAX_RECENT_ALIGNMENTS = 4
+
+def date_alignment(olddates, newdates):
+    """ Returns a DateAlignment of olddates onto newdates, reusing a recent
+        one for the same dates if possible.
+    """
+
+    for alignment in _recent_alignments:
+        if alignment.matches(olddates, newdates):
+            _recent_alignments.remove(alignment)
+            break
+    else:
+        alignment = DateAlignment(olddates, newdates)
+        if len(_recent_alignments) >= MAX_RECENT_ALIGNMENTS:
+            del _recent_alignments[0]
+
+    _recent_alignments.append(alignment)
+    return alignment
+
+
+def _date_floats(dates):
+    """ Maps an array of datetime64 onto float seconds since the epoch. """
+
+    return np.asarray(dates).astype('M8[s]').astype(np.int64).astype(float)
+
+
+def align_panel(panel, symbols, dates=None):
+    """ Aligns the series of symbols in a PricePanel onto common dates.
+        Parameters:
+            panel: PricePanel, as returned by price_utils.load_many, with
+                NaN where a symbol has no entry
+            symbols: symbols to align, all of which must have data
+            dates: optional dates to align to, by default those of the
+                symbol with the latest start
+        Returns:
+            PricePanel of the symbols on the dates every one of them covers,
+            each series interpolated over its own gaps
+    """
+
+    adjclose = panel['adjclose']
+    cols = [panel.column(symbol) for symbol in symbols]
+    valid = [~np.isnan(adjclose[:, col]) for col in cols]
+
+    if dates is None:
+        starts = [panel.dates[v][0] for v in valid]
+        dates = panel.dates[valid[int(np.argmax(starts))]]
+
+    flds = price_utils.price_db.panel_fields
+    aligned = np.empty((len(flds), len(dates), len(symbols)), dtype=float)
+    keep = np.ones(len(dates), dtype=bool)
+    for j, col in enumerate(cols):
+        alignment = DateAlignment(panel.dates[valid[j]], dates)
+        data = np.vstack([panel[fld][valid[j], col] for fld in flds])
+        aligned[:, alignment.mask, j] = alignment(data)
+        keep &= alignment.mask
+
+    fields = dict((fld, np.ascontiguousarray(aligned[i][keep]))
+                  for i, fld in enumerate(flds))
+    return price_utils.PricePanel(symbols, dates[keep], fields)
+
+
+def solve_mean_variance(e, C, rt, lower=-np.inf, upper=np.inf, x0=None,
+                        tol=1e-10, max_iter=10000):
+    """ Solves the bounded mean-variance problem directly, maximizing
+        Sharpe's utility
+        
+            e'x - (1/rt)*x'Cx
+            
+        subject to sum(x) == 1 and lower <= x <= upper, by accelerated
+        projected gradient ascent.
+        Parameters:
+            e: vector of expected returns
+            C: covariance matrix of the returns
+            rt: investor risk tolerance
+            lower, upper: bounds on the weights, scalars or vectors
+            x0: optional starting weights, equal weights by default
+            tol: stop once no weight moves by more than this in a step
+        Returns:
+            (weights array, number of iterations)
+    """
+
+    e = np.asarray(e, dtype=float).ravel()
+    C = np.asarray(C, dtype=float)
+    n = len(e)
+    lower = np.ones(n)*lower
+    upper = np.ones(n)*upper
+    if lower.sum() > 1.0 or upper.sum() < 1.0 or np.any(lower > upper):
+        raise ValueError("No weights within bounds sum to 1.0")
+
+    # The gradient e - (2/rt)*C*x changes at most this fast
+    lipschitz = 2.0*np.linalg.eigvalsh(C)[-1]/rt
+    step = 1.0/lipschitz if lipschitz > 0 else 1.0
+
+    if x0 is None:
+        x0 = np.ones(n)/n
+    x = _project_weights(np.asarray(x0, dtype=float), lower, upper)
+    y = x
+    t = 1.0
+    for count in range(1, max_iter+1):
+        grad = e - (2.0/rt)*np.dot(C, y)
+        xnew = _project_weights(y + step*grad, lower, upper)
+        if np.abs(xnew - x).max() <= tol:
+            x = xnew
+            break
+        tnew = (1.0 + np.sqrt(1.0 + 4.0*t*t))/2.0
+        y = xnew + ((t - 1.0)/tnew)*(xnew - x)
+        x, t = xnew, tnew
+
+    return x, count
+
+
+def _project_weights(v, lower, upper):
+    """ Euclidean projection of v onto {x: sum(x) == 1, lower <= x <= upper},
+        which is clip(v - tau, lower, upper) for the tau making it sum to 1.
+    """
+
+    def total(tau):
+        return np.clip(v - tau, lower, upper).sum()
+
+    # The sum falls as tau rises, bracket the crossing of 1.0 starting
+    #   from the unbounded answer.
+    tau = (v.sum() - 1.0)/len(v)
+    width = 1.0
+    while total(tau - width) < 1.0:
+        width *= 2.0
+    lo = tau - width
+    width = 1.0
+    while total(tau + width) > 1.0:
+        width *= 2.0
+    hi = tau + width
+
+    for i in range(200):
+        mid = 0.5*(lo + hi)
+        if total(mid) > 1.0:
+            lo = mid
+        else:
+            hi = mid
+        if hi - lo <= 1e-15*max(1.0, abs(mid)):
+            break
+
+    # The sum is linear in tau between the brackets, interpolate exactly
+    slo = total(lo)
+    shi = total(hi)
+    tau = hi if slo == shi else lo + (slo - 1.0)*(hi - lo)/(slo - shi)
+    return np.clip(v - tau, lower, upper)
+
+
+# Stamps each update of a Stock's data, so cached results derived from it
+#   can tell when they are stale.  Stocks come out of the disk tier of the
+#   metrics cache with stamps from other processes, hence the token.
+_data_version_token = uuid.uuid4().hex
+_data_versions = itertools.count(1)
+
+
+def _metrics_cache(cache):
+    """ Resolves the cache argument of Stock and Portfolio. """
+    if cache is True:
+        return default_cache
+    elif cache is False:
+        return None
+    return cache
 
 
 class Stock(object):
     
     def __init__(self, symbol, startdate="1995-1-1",
-        enddate="2011-7-31", dbfilename='data/stocks.db', bench='LALDX', rfr=0.015):
+        enddate="2011-7-31", dbfilename='data/stocks.db', bench='LALDX', rfr=0.015,
+        stock_data=None, bench_data=None, cache=True):
         """ Stock object with some methods to call metrics functions to pre-
             populate some attributes, as well as methods to impute to a given
             datearray.
+
+            stock_data and bench_data may be passed in already loaded (see
+            Stock.from_panel), in which case nothing is read from dbfilename.
+            Otherwise the results are looked up in cache, a
+            metrics_cache.MetricsCache (True for the default one, False for
+            none), before loading the data.
         """
 
         self.symbol = symbol
@@ -66,14 +277,29 @@ class Stock(object):
         self.stock_data_cache = None
         self.bench_data_cache = None
         
-        self.bench_data = price_utils.load_from_db(bench,
+        cache = _metrics_cache(cache)
+        if stock_data is not None or bench_data is not None:
+            cache = None
+        if cache is not None:
+            key = (db_version(dbfilename), symbol, startdate, enddate,
+                   'adjclose', rfr, bench)
+            state = cache.get(key)
+            if state is not None:
+                self.__dict__.update(state)
+                return
+
+        if bench_data is None:
+            bench_data = price_utils.load_from_db(bench,
                                         self.startdate,
                                         self.enddate,
                                         dbfilename=dbfilename)
-        self.stock_data = price_utils.load_from_db(symbol,
+        if stock_data is None:
+            stock_data = price_utils.load_from_db(symbol,
                                         self.startdate,
                                         self.enddate,
                                         dbfilename=dbfilename)
+        self.bench_data = bench_data
+        self.stock_data = stock_data
 
         # Bail out of initialization if there is no data
         if len(self.stock_data)==0:
@@ -85,6 +311,61 @@ class Stock(object):
         if not self.impute_to(sdates):
             self.update_metrics()
 
+        if cache is not None:
+            cache.put(key, self.state())
+
+
+    @classmethod
+    def from_panel(cls, panel, symbol, bench, startdate, enddate, rfr=0.015,
+                   rates=None, bench_data=None, stock_data_cache=None,
+                   beta=None):
+        """ Builds a Stock from an aligned PricePanel (see align_panel),
+            without touching the database.
+
+            Parameters:
+                panel: aligned PricePanel holding symbol and bench
+                rates: optional dict of symbol to rate array already
+                    computed from the panel, for symbol and bench
+                bench_data: optional benchmark records to share between
+                    the stocks of a portfolio
+                stock_data_cache: optional original (unaligned) records
+                beta: optional beta_bb already computed from the rates
+        """
+
+        stock = cls.__new__(cls)
+        stock.symbol = symbol
+        stock.benchsymbol = bench
+        stock.startdate = startdate
+        stock.enddate = enddate
+        stock.rfr = rfr
+        stock.stock_data_cache = stock_data_cache
+        stock.bench_data_cache = None
+
+        if bench_data is None:
+            bench_data = panel.records(bench)
+        stock.bench_data = bench_data
+        stock.stock_data = panel.records(symbol)
+        if rates is None:
+            stock.update_metrics(beta=beta)
+        else:
+            stock.update_metrics(rates[symbol], rates[bench], beta)
+        return stock
+
+
+
+    @classmethod
+    def from_state(cls, state):
+        """ Builds a Stock from the attributes returned by state(). """
+        stock = cls.__new__(cls)
+        stock.__dict__.update(state)
+        return stock
+
+    def state(self):
+        """ Returns the attributes of the stock, for caching.  Arrays are
+            given as read-only copies (see metrics_cache.read_only), so
+            stocks built from the state share them safely.
+        """
+        return read_only(self.__dict__)
 
     def impute_to(self, dts, cache_originals=False):
         """ Method impute stock data to match given dates.
@@ -94,45 +375,65 @@ class Stock(object):
         """
         # Check alignment of bench_data as a test whether we need to impute
         #   TODO: this is a bit hackish
-        if not np.alltrue(self.bench_data['date']==dts):
-            sdata = []
-            ssymb = [self.benchsymbol for x in range(len(dts))]
-            bdata = []
-            bsymb = [self.benchsymbol for x in range(len(dts))]
-
-            for fld in price_schema.names[2:]:
-                sdata.append(align_dates(self.stock_data['date'], self.stock_data[fld], dts))
-                bdata.append(align_dates(self.bench_data['date'], self.bench_data[fld], dts))
-
-            srecs = zip(ssymb, dts, *tuple(sdata))
-            brecs = zip(bsymb, dts, *tuple(bdata))
+        if not np.array_equal(self.bench_data['date'], dts):
+            flds = price_schema.names[2:]
+            salign = date_alignment(self.stock_data['date'], dts)
+            balign = date_alignment(self.bench_data['date'], dts)
+
+            # Interpolate all fields of each series in one go, keeping the
+            #   dates both series cover.
+            keep = salign.mask & balign.mask
+            sdata = salign(np.vstack([self.stock_data[fld] for fld in flds]))
+            bdata = balign(np.vstack([self.bench_data[fld] for fld in flds]))
+            sdata = sdata[:, keep[salign.mask]]
+            bdata = bdata[:, keep[balign.mask]]
+
+            srecs = np.empty(keep.sum(), dtype=self.stock_data.dtype)
+            brecs = np.empty(keep.sum(), dtype=self.bench_data.dtype)
+            srecs['symbol'] = self.symbol
+            brecs['symbol'] = self.benchsymbol
+            srecs['date'] = brecs['date'] = dts[keep]
+            for i, fld in enumerate(flds):
+                srecs[fld] = sdata[i]
+                brecs[fld] = bdata[i]
 
             if cache_originals:
                 self.stock_data_cache = self.stock_data
                 self.bench_data_cache = self.bench_data
 
-            self.stock_data = np.array(srecs, dtype=price_schema)
-            self.bench_data = np.array(brecs, dtype=price_schema)
+            self.stock_data = srecs
+            self.bench_data = brecs
             self.update_metrics()
             return True
         else:
             return False
 
 
-    def update_metrics(self):
+    def update_metrics(self, ratearray=None, bencharray=None, beta=None):
+        """ Recalculates the metrics, using the rate arrays and beta_bb
+            given if they have already been computed for the current data.
+        """
         self.dates = self.stock_data['date']
         self.stock_prices = self.stock_data['adjclose']
         self.bench_prices = self.bench_data['adjclose']
-        self.ratearray = rate_array(self.stock_data)
-        self.bencharray = rate_array(self.bench_data)
+        if ratearray is None:
+            ratearray = rate_array(self.stock_data)
+        if bencharray is None:
+            bencharray = rate_array(self.bench_data)
+        self.ratearray = ratearray
+        self.bencharray = bencharray
+        self.data_version = (_data_version_token, next(_data_versions))
 
         # TODO: Not sure if these are the metrics I'm looking for...
         self.annual_volatility = volatility(self.ratearray)
-        self.beta = beta_bb(self.ratearray, self.bencharray)
+        if beta is None:
+            beta = beta_bb(self.ratearray, self.bencharray)
+        self.beta = beta
         self.annualized_adjusted_return = annualized_adjusted_rate(self.ratearray, rfr=0.01)
         self.expected_return = expected_return(self.ratearray,
                                                self.bencharray,
-                                               rfr=self.rfr)
+                                               rfr=self.rfr,
+                                               betai=self.beta)
         return
 
 
@@ -147,27 +448,39 @@ class Portfolio(object):
                        weights = "equal",
                        startdate="2004-1-1",
                        enddate="2011-8-12",
-                       dbfilename="data/indexes.db"):
+                       dbfilename="data/indexes.db",
+                       bench="LALDX",
+                       rfr=0.015,
+                       cache=True):
+        """ The stock data and metrics are looked up in cache, a
+            metrics_cache.MetricsCache (True for the default one, False for
+            none), before loading them from dbfilename.
+        """
 
         self.startdate = startdate
         self.enddate = enddate
         self.dbfilename = dbfilename
+        self.benchsymbol = bench
 
-        self.stocks = {}
-
-        # Get stock data:
-        print "Adding: ",
-        for symbol in symbols:
-            print symbol,
-            s = Stock(symbol, startdate, enddate, self.dbfilename)
-
-            # Only add it to the portfolio if it has data
-            if len(s.stock_data)>0:
-                self.stocks[symbol] = s
-
-        self.symbols = self.stocks.keys()
-        self.symbols.sort()
-        self.level_lengths()
+        market = None
+        cache = _metrics_cache(cache)
+        if cache is not None:
+            key = (db_version(dbfilename), tuple(symbols), startdate, enddate,
+                   'adjclose', rfr, bench)
+            market = cache.get(key)
+        if market is None:
+            market = self._load_market(symbols, bench, rfr)
+            if cache is not None:
+                cache.put(key, market)
+
+        self.panel = market['panel']
+        self.dates = self.panel.dates
+        self.regression = market['regression']
+        self.bench_data = market['bench_data']
+        self.symbols = list(market['symbols'])
+        self.stocks = dict((symbol, Stock.from_state(state))
+                           for symbol, state in market['stocks'].items())
+        self._market_key = None
         
         if weights=="equal":
             self.weights = dict(zip(self.symbols, self.equal_weight()))
@@ -179,13 +492,79 @@ class Portfolio(object):
         return
     
 
+    def _load_market(self, symbols, bench, rfr):
+        """ Loads and aligns the data for the symbols with data and the
+            benchmark, and computes the stock metrics.  Returns a dict of
+            the results that can be kept in a MetricsCache.
+        """
+        startdate = self.startdate
+        enddate = self.enddate
+        stocks = {}
+
+        # Get all of the stock data, and the benchmark once, in one panel
+        raw = price_utils.load_many(list(symbols) + [bench], startdate,
+                                    enddate, dbfilename=self.dbfilename)
+        counts = (~np.isnan(raw['adjclose'])).sum(axis=0)
+        if counts[raw.column(bench)] == 0:
+            raise ValueError("No data for benchmark %s" % bench)
+
+        print "Adding: ",
+        held = []
+        for symbol in symbols:
+            print symbol,
+            # Only add it to the portfolio if it has data
+            if counts[raw.column(symbol)] > 0 and symbol not in held:
+                held.append(symbol)
+        held.sort()
+
+        # Impute everything to the dates of the symbol with the latest start
+        columns = held + [symb for symb in [bench] if symb not in held]
+        panel = align_panel(raw, columns)
+
+        # Rates for every column at once, shared by the stocks
+        dt_rates = np.dtype({'names':['date', 'rate'],
+                             'formats':[panel.dates.dtype, float]})
+        ratematrix = rate_matrix(panel['adjclose'].T)
+        rates = {}
+        for symbol in columns:
+            ratearray = np.empty(len(panel.dates), dtype=dt_rates)
+            ratearray['date'] = panel.dates
+            ratearray['rate'] = ratematrix[panel.column(symbol)]
+            rates[symbol] = ratearray
+
+        # Regress all of the stocks on the benchmark at once
+        regression = regress_matrix(
+            ratematrix[[panel.column(symbol) for symbol in held]],
+            ratematrix[panel.column(bench)])
+
+        # Shared by the stocks, and through the cache
+        bench_data = read_only(panel.records(bench))
+        for i, symbol in enumerate(held):
+            # Keep the original data around where imputing changed it
+            original = raw.records(symbol)
+            if np.array_equal(original['date'], panel.dates):
+                original = None
+            stock = Stock.from_panel(panel, symbol, bench,
+                startdate, enddate, rfr=rfr, rates=rates,
+                bench_data=bench_data, stock_data_cache=original,
+                beta=regression['beta_bb'][i])
+            stocks[symbol] = stock.state()
+
+        # The results are shared through the cache
+        for values in panel.fields.values():
+            values.flags.writeable = False
+        return {'panel':panel, 'regression':read_only(regression),
+                'bench_data':bench_data, 'symbols':held, 'stocks':stocks}
+        
+        
     def level_lengths(self):
         """ Method to truncate earlier dates in stock recarrays where they
             all match.  Only do this for ratearray and bencharray objects
             in the stock objects for now.  This also assumes that the bench-
             mark data will always be longer than the shortest stock data.
-            TODO: there are still problems with the benchmark data needing 
-            truncation/imputing.
+
+            Note: the stocks are already aligned on construction (see
+            align_panel), so this is only needed if their data is replaced.
         """
 
         # Start with a very early date.
@@ -209,6 +588,54 @@ class Portfolio(object):
         return
         
         
+    def market_key(self):
+        """ Identifies the data the cached market arrays are derived from:
+            the symbols, the date window and the version of each stock's data.
+        """
+        versions = tuple((symbol, self.stocks[symbol].data_version)
+                         for symbol in self.symbols)
+        return (self.startdate, self.enddate, versions)
+        
+        
+    def update_market_cache(self):
+        """ Recomputes the rates matrix, expected return vector and covariance
+            matrix of the stocks if the stocks, dates or their data have
+            changed since they were last computed.
+        """
+        key = self.market_key()
+        if getattr(self, "_market_key", None) != key:
+            self._rates = np.array([self.stocks[symbol].ratearray['rate']
+                                    for symbol in self.symbols])
+            self._expected_returns = np.array(
+                [self.stocks[symbol].annualized_adjusted_return
+                 for symbol in self.symbols])
+            self._covariance = np.cov(self._rates)
+            self._market_key = key
+        return
+        
+    @property
+    def rates(self):
+        """ N x T array of the stock rates, in the order of self.symbols """
+        self.update_market_cache()
+        return self._rates
+        
+    @property
+    def expected_returns(self):
+        """ Vector of stock returns (annualized_adjusted_return) used as
+            the expected returns, in the order of self.symbols
+        """
+        self.update_market_cache()
+        return self._expected_returns
+        
+    @property
+    def covariance(self):
+        """ Covariance matrix of the stock rates, in the order of
+            self.symbols
+        """
+        self.update_market_cache()
+        return self._covariance
+        
+        
     def equal_weight(self):
         return [1.0/len(self.symbols) for symbol in self.symbols]
         
@@ -277,19 +704,8 @@ class Portfolio(object):
             
         """
         
-        e_ary = np.array([self.stocks[symbol].annualized_adjusted_return for symbol in self.symbols])
-        
-        e = np.mat(e_ary).T
-        
-        ratelist = []
-        
-        for symb in self.symbols:
-            ratelist.append(self.stocks[symb].ratearray['rate'].tolist())
-
-        rates = np.array(ratelist, dtype=float)
-        
-        cv = np.cov(rates)
-        C = np.mat(cv)
+        e = np.mat(self.expected_returns).T
+        C = np.mat(self.covariance)
         
         weights = np.array([self.weights[symbol] for symbol in self.symbols])
         x = np.mat(weights).T
@@ -314,14 +730,12 @@ class Portfolio(object):
         mubuy = -1E200
         musell = 1E200
         
-        p1 = self
-        if getattr(p1, "port_opt", None) is None:
-            self.port_opt = p2 = copy.deepcopy(p1)
+        if getattr(self, "port_opt", None) is None:
+            self.port_opt = p2 = OptimizationState(self)
         else:
             p2 = self.port_opt
         
-        weights = np.array([p2.weights[symbol] for symbol in p2.symbols])
-        x = np.mat(weights).T
+        x = np.mat(p2.x).T
         
         mu = p2.calc_marginal_utility(rt)
         
@@ -344,8 +758,7 @@ class Portfolio(object):
         s[ibuy]=1.0
         s = np.mat(s)
         
-        rates = np.array([p2.stocks[symbol].ratearray['rate'] for symbol in p2.symbols])
-        C = np.mat(np.cov(rates))
+        C = np.mat(p2.covariance)
         
         k0 = s.T*mu
         k1 = (s.T*C*s)/rt
@@ -358,19 +771,17 @@ class Portfolio(object):
         # but it's calculated here for potential future use.
         cu = k0*a - k1*(a**2)
         
-        symb_sell = p2.symbols[isell]
-        symb_buy = p2.symbols[ibuy]
-        if symb_sell == symb_buy:
+        if isell == ibuy:
             a = 0.0
         
         # Keep within the bounds
-        if p2.weights[symb_sell]-a < lower_bound_weight:
-            a = p2.weights[symb_sell]-lower_bound_weight
-        if p2.weights[symb_buy]+a >upper_bound_weight:
-            a = upper_bound_weight-p2.weights[symb_buy]
+        if p2.x[isell]-a < lower_bound_weight:
+            a = p2.x[isell]-lower_bound_weight
+        if p2.x[ibuy]+a >upper_bound_weight:
+            a = upper_bound_weight-p2.x[ibuy]
             
-        p2.weights[symb_sell] = p2.weights[symb_sell]-a
-        p2.weights[symb_buy] = p2.weights[symb_buy]+a
+        p2.x[isell] = p2.x[isell]-a
+        p2.x[ibuy] = p2.x[ibuy]+a
         
         #print("Recommend Sell: %s" % symb_sell)
         #print("Recommend Buy: %s" % symb_buy)
@@ -380,17 +791,38 @@ class Portfolio(object):
         
     def optimize_portfolio(self, rt=0.10,
                            lower_bound_weight=-0.50,
-                           upper_bound_weight=1.5):
-        """ Simple optimization wrapper to set bounds and limit iterations """
-
-        a = 1.0
-        count = 0
+                           upper_bound_weight=1.5,
+                           method="sharpe"):
+        """ Simple optimization wrapper to set bounds and limit iterations.
         
-        while a>0.00001:
-            a = self.step_port_return(rt, lower_bound_weight,
-                                      upper_bound_weight)
+            method: "sharpe" steps through Sharpe's two-stock swaps until
+                they stop improving things, "qp" solves the bounded
+                mean-variance problem directly (see solve_mean_variance).
+            
+            The optimal weights are left in self.port_opt.weights, and
+            returned.
+        """
 
-            count+=1
+        if method == "sharpe":
+            a = 1.0
+            count = 0
+            
+            while a>0.00001:
+                a = self.step_port_return(rt, lower_bound_weight,
+                                          upper_bound_weight)
+    
+                count+=1
+        elif method == "qp":
+            if getattr(self, "port_opt", None) is None:
+                self.port_opt = OptimizationState(self)
+            p2 = self.port_opt
+            
+            p2.x, count = solve_mean_variance(p2.expected_returns,
+                                              p2.covariance, rt,
+                                              lower_bound_weight,
+                                              upper_bound_weight, p2.x)
+        else:
+            raise ValueError("Unknown optimization method: %s" % method)
         
         result = self.port_opt.evaluate_holdings()
         variance = round(result[0],3)
@@ -402,6 +834,70 @@ class Portfolio(object):
         opt_rate_array = self.port_opt.calc_port_rates()
         print("Portfolio Rate Array:%s\n" % opt_rate_array[:10])
         
+        return self.port_opt.weights
+        
+        
+class OptimizationState(object):
+    """ The weights being optimized for a Portfolio, held in its port_opt
+        attribute.  Only the weight vector belongs to the state; the
+        symbols, rates, expected returns and covariance are references to
+        the portfolio's (read-only) cached arrays, so no stock data is
+        copied.
+    """
+    
+    def __init__(self, portfolio, weights=None):
+        if weights is None:
+            weights = portfolio.weights
+        self.symbols = portfolio.symbols
+        self.rates = portfolio.rates
+        self.expected_returns = portfolio.expected_returns
+        self.covariance = portfolio.covariance
+        self.dates = portfolio.stocks[self.symbols[0]].ratearray['date']
+        self.x = np.array([weights[symbol] for symbol in self.symbols],
+                          dtype=float)
+        
+    def _get_weights(self):
+        return dict(zip(self.symbols, self.x.tolist()))
+        
+    def _set_weights(self, weights):
+        self.x = np.array([weights[symbol] for symbol in self.symbols],
+                          dtype=float)
+        
+    weights = property(_get_weights, _set_weights,
+                       doc="Dict of symbol to weight, as on Portfolio")
+        
+    def evaluate_holdings(self):
+        """ Updates the portfolio return and variance for the current
+            weights, returning a tuple of (variance, portfolio_return).
+        """
+        self.portfolio_return = np.dot(self.expected_returns, self.x)
+        variance = self.calc_variance()
+        return variance, self.portfolio_return
+        
+    def calc_port_rates(self):
+        dt_rates = np.dtype({'names':['date', 'rate'],
+                             'formats':[self.dates.dtype, float]})
+        port_ratearray = np.empty(len(self.dates), dtype=dt_rates)
+        port_ratearray['date'] = self.dates
+        port_ratearray['rate'] = np.dot(self.x, self.rates)
+        self.port_ratearray = port_ratearray
+        return port_ratearray
+        
+    def calc_variance(self):
+        """ Portfolio variance for the current weights. """
+        self.volatility = volatility(self.calc_port_rates())
+        self.variance = self.volatility**2
+        return self.variance
+        
+    def calc_marginal_utility(self, rt=0.20):
+        """ Sharpe's marginal utility, mu = e - (1/rt)*2*C*x (see
+            Portfolio.calc_marginal_utility)
+        """
+        e = np.mat(self.expected_returns).T
+        C = np.mat(self.covariance)
+        x = np.mat(self.x).T
+        return e - (1/rt)*2*C*x
+        
         
 # EOF ####################################################################
 
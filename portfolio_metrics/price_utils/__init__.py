@@ -9,8 +9,11 @@ License: BSD
 """
 
 from price_data import get_yahoo_prices
-from price_db import (adapt_datetime, convert_datetime, save_to_db,
-                      load_from_db, populate_db, all_symbols, symbol_exists,
-                      load_symbols_from_table, populate_symbol_list)
+from price_db import (adapt_datetime, convert_datetime, save_to_db, save_many,
+                      load_from_db, load_columns, load_many, populate_db,
+                      all_symbols, symbol_exists, load_symbols_from_table,
+                      populate_symbol_list, get_connection, close_connections,
+                      migrate_db, refresh_db, data_version, PricePanel)
+from price_fetch import download_prices, fetch_prices, RateLimiter
 
 
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+price_cache.py
+
+Memory-mapped cache of the price histories in a price database.  Each
+symbol gets a directory next to the database file holding one .npy file
+per price field plus a 'date' index, all in date order:
+
+    data/stocks.db.cache/AAPL/date.npy
+    data/stocks.db.cache/AAPL/adjclose.npy
+    ...
+    data/stocks.db.cache/AAPL/version
+
+The files are opened with mmap_mode='r', so reading a date range is a
+binary search on the date index and a slice of each field -- no SQL and no
+copying until the caller asks for it.  Each entry records the
+price_db.data_version of the database it was read from, and is only used
+while the database is at that version.  save_to_db also removes the
+entries for the symbols it writes.
+
+Copyright (c) 2011 Vaught Management, LLC.
+License: BSD
+"""
+
+# Standard library imports
+import os
+import shutil
+import sys
+
+# Major library imports
+import numpy as np
+
+# Local imports
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir))
+from ts_utils import write_atomically
+
+# Fields stored for each symbol, along with the 'date' index
+cache_fields = ['open', 'high', 'low', 'close', 'volume', 'adjclose']
+
+
+def cache_dir(dbfilename):
+    """ Returns the directory holding the cache for dbfilename. """
+
+    return dbfilename + ".cache"
+
+
+def _symbol_dir(dbfilename, symbol):
+    return os.path.join(cache_dir(dbfilename), symbol.replace(os.sep, "-"))
+
+
+def load_symbol(symbol, dbfilename, version=None):
+    """ Returns a dict of read-only memory-mapped arrays, keyed by 'date' and
+        the cache_fields, for the full history of symbol.  Returns None if
+        the symbol is not cached, or (when version is given) was cached
+        from another version of the database.
+    """
+
+    path = _symbol_dir(dbfilename, symbol)
+    if not os.path.isdir(path):
+        return None
+
+    columns = {}
+    try:
+        if version is not None:
+            with open(os.path.join(path, "version")) as f:
+                if f.read() != repr(tuple(version)):
+                    return None
+        for fld in ['date'] + cache_fields:
+            filename = os.path.join(path, fld + ".npy")
+            columns[fld] = np.load(filename, mmap_mode='r')
+    except (IOError, OSError, ValueError):
+        # Partially removed or corrupt entry, treat as a miss.
+        return None
+    return columns
+
+
+def store_symbol(symbol, table, dbfilename, version=None):
+    """ Writes the full history of symbol, a price_data.schema array in date
+        order, to the cache and returns it as load_symbol would.  version is
+        the data_version of the database the history was read from, taken
+        before reading it.
+    """
+
+    root = cache_dir(dbfilename)
+    if not os.path.isdir(root):
+        os.makedirs(root)
+
+    def write(tmpdir):
+        np.save(os.path.join(tmpdir, "date.npy"),
+                table['date'].astype('M8[D]'))
+        for fld in cache_fields:
+            np.save(os.path.join(tmpdir, fld + ".npy"),
+                    np.ascontiguousarray(table[fld], dtype=float))
+        if version is not None:
+            with open(os.path.join(tmpdir, "version"), "w") as f:
+                f.write(repr(tuple(version)))
+
+    path = _symbol_dir(dbfilename, symbol)
+    try:
+        write_atomically(path, write, directory=True)
+    except OSError:
+        # Another writer got there first; its copy is just as good (or
+        #   will miss, if it was for another version).
+        if not os.path.isdir(path):
+            raise
+
+    return load_symbol(symbol, dbfilename, version)
+
+
+def invalidate(symbols, dbfilename):
+    """ Removes the cache entries for symbols. """
+
+    for symbol in symbols:
+        path = _symbol_dir(dbfilename, symbol)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def clear(dbfilename):
+    """ Removes the whole cache for dbfilename. """
+
+    root = cache_dir(dbfilename)
+    if os.path.isdir(root):
+        shutil.rmtree(root, ignore_errors=True)
+
+
+#### EOF ##################################################################
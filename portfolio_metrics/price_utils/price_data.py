@@ -21,6 +21,12 @@ schema = np.dtype({'names':['symbol', 'date', 'open', 'high', 'low',
                    'formats':['S8', 'M8[D]', float, float, float, float,
                        float, float]})
 
+# Requests per second to allow the price server by default (see
+#   price_fetch.RateLimiter).  Every download goes to the one server, so
+#   this limits a whole pool of fetchers, and is set to let a full pool run
+#   in parallel.
+request_rate = 25.0
+
 def get_yahoo_prices(symbol, startdate=None, enddate=None,
                      period='d', datefmt="%Y-%m-%d"):
     """ Utility function to pull price data from Yahoo Finance site.
@@ -45,6 +51,20 @@ def get_yahoo_prices(symbol, startdate=None, enddate=None,
                                 float, float]})
     """
     
+    startdate, enddate = parse_date_range(startdate, enddate, datefmt)
+    url = yahoo_url(symbol, startdate, enddate, period)
+    
+    filehandle = urlopen(url)
+    lines = filehandle.readlines()
+    
+    return parse_price_csv(lines, symbol)
+    
+    
+def parse_date_range(startdate=None, enddate=None, datefmt="%Y-%m-%d"):
+    """ Converts startdate and enddate strings into datetimes, defaulting
+        to the year ending yesterday.
+    """
+    
     todaydate = datetime.date(*time.localtime()[:3])
     yesterdate = todaydate - datetime.timedelta(1)
     lastyeardate = todaydate - datetime.timedelta(365)
@@ -59,14 +79,27 @@ def get_yahoo_prices(symbol, startdate=None, enddate=None,
     else:
         enddate = datetime.datetime.strptime(enddate, datefmt)
     
+    return startdate, enddate
+    
+    
+def yahoo_url(symbol, startdate, enddate, period='d'):
+    """ Returns the Yahoo Finance url of the price history csv for symbol
+        between the startdate and enddate datetimes.
+    """
+    
     # Note: account for Yahoo's messed up 0-indexed months
     url = "http://ichart.finance.yahoo.com/table.csv?s=%s&a=%d&b=%d&c=%d&"\
               "d=%d&e=%d&f=%d&y=0&g=%s&ignore=.csv" % (symbol,
               startdate.month-1, startdate.day, startdate.year,
               enddate.month-1, enddate.day, enddate.year, period)
+    return url
     
-    filehandle = urlopen(url)
-    lines = filehandle.readlines()
+    
+def parse_price_csv(lines, symbol):
+    """ Converts the lines of a Yahoo style price csv (Date, Open, High,
+        Low, Close, Volume, Adj Close with a header line) into an array
+        in our schema.
+    """
     
     data = []
     
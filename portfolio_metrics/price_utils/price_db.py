@@ -13,15 +13,46 @@ import os
 import sys
 import datetime, time
 import csv
+import threading
+import uuid
 
 # Major library imports
 import numpy as np
 import sqlite3
 
 # Local imports
+import price_cache
 import price_data
-
-
+import price_fetch
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir))
+from ts_utils import range_slice
+
+# Current version of the database schema, stored as the "user_version" of
+#   the database file.  Version 2 stores dates as integer day numbers since
+#   the epoch; older files stored float seconds (see adapt_datetime) and
+#   need to be brought up to date with migrate_db.  Version 3 adds the
+#   data_version table (see data_version).
+SCHEMA_VERSION = 3
+
+# Layout of a stocks row as fetched from the db, with the date still a day
+#   number.  It matches the memory layout of price_data.schema, so fetched
+#   rows can be viewed as such without touching each record.
+db_schema = np.dtype({'names':['symbol', 'date', 'open', 'high', 'low',
+                          'close', 'volume', 'adjclose'],
+                      'formats':['S8', 'i8', float, float, float, float,
+                          float, float]})
+
+symbol_list_schema = np.dtype({'names':['symbol', 'startdate', 'enddate',
+                                   'entries'],
+                               'formats':['S8', 'M8[D]', 'M8[D]', long]})
+db_symbol_list_schema = np.dtype({'names':['symbol', 'startdate', 'enddate',
+                                      'entries'],
+                                  'formats':['S8', 'i8', 'i8', long]})
+
+
+# Note: adapt_datetime and convert_datetime handle the float seconds dates
+#    of schema version 1 and are no longer used by current databases.
 def adapt_datetime(dt):
     # Get the datetime for the POSIX epoch.
     epoch = datetime.datetime.utcfromtimestamp(0.0)
@@ -43,19 +74,159 @@ def convert_datetime(tf):
 sqlite3.register_adapter(datetime.datetime, adapt_datetime)
 sqlite3.register_converter("datetime", convert_datetime)
 
+# Price fields held as float columns in a PricePanel
+panel_fields = ['open', 'high', 'low', 'close', 'volume', 'adjclose']
+
+# Keep well under SQLite's limit on the number of bound parameters
+MAX_QUERY_SYMBOLS = 900
+
+# Pool of open connections, keyed by database file name.  Connections are
+#   kept per thread since sqlite3 connections can't be shared across threads.
+_pool = threading.local()
+
+
+class PricePanel(object):
+    """ Dense date x symbol panel of price data.  Each field in panel_fields
+        is a contiguous float64 array of shape (len(dates), len(symbols)),
+        with NaN wherever a symbol has no entry for a date.
+    """
+    
+    def __init__(self, symbols, dates, fields):
+        self.symbols = list(symbols)
+        self.dates = dates
+        self.fields = fields
+        self._columns = dict((symb, i) for i, symb in enumerate(self.symbols))
+        
+    def __getitem__(self, field):
+        return self.fields[field]
+        
+    def __contains__(self, symbol):
+        return symbol in self._columns
+        
+    def column(self, symbol):
+        """ Returns the column index of symbol in the field arrays. """
+        return self._columns[symbol]
+        
+    def records(self, symbol):
+        """ Returns the data for symbol as a record array in the same form
+            load_from_db returns, skipping dates with no entry.
+        """
+        col = self._columns[symbol]
+        valid = ~np.isnan(self.fields['adjclose'][:, col])
+        
+        table = np.empty(int(valid.sum()), dtype=price_data.schema)
+        table['symbol'] = symbol
+        table['date'] = self.dates[valid]
+        for fld in panel_fields:
+            table[fld] = self.fields[fld][valid, col]
+        return table
+
+
+def get_connection(dbfilename="data/stocks.db"):
+    """ Returns an open connection to dbfilename from the pool, connecting
+        for the calling thread if needed.  Raises IOError if the file uses
+        an older schema version.
+    """
+    
+    conns = getattr(_pool, 'connections', None)
+    if conns is None:
+        conns = _pool.connections = {}
+        
+    key = os.path.abspath(dbfilename)
+    conn = conns.get(key)
+    if conn is None:
+        conn = _connect(dbfilename)
+        conns[key] = conn
+    return conn
+    
+    
+def _connect(dbfilename):
+    """ Opens a new connection to dbfilename, raising IOError if the file
+        uses an older schema version.
+    """
+    
+    conn = sqlite3.connect(dbfilename)
+    version = schema_version(conn)
+    if version < SCHEMA_VERSION:
+        conn.close()
+        raise IOError("%s uses schema version %s, run migrate_db on it "
+                      "to update it to version %s" % (dbfilename, version,
+                                                      SCHEMA_VERSION))
+    return conn
+    
+    
+def close_connections():
+    """ Closes all pooled connections opened by the calling thread. """
+    
+    conns = getattr(_pool, 'connections', {})
+    for conn in conns.values():
+        conn.close()
+    conns.clear()
+    
+
+def schema_version(conn):
+    """ Returns the schema version of the database open on conn. """
+
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def data_version(dbfilename="data/stocks.db"):
+    """ Returns (token, count) for dbfilename: the token is set when the
+        file is created and count goes up with every save_many, so results
+        computed from the file are current only while both are unchanged.
+        Anything writing prices other than through save_many must bump the
+        count too (see save_many), or the price_cache and metrics_cache
+        entries for the file will be stale.
+    """
+
+    conn = get_connection(dbfilename)
+    return tuple(conn.execute("SELECT token, version FROM data_version;"
+                              ).fetchone())
+
 
+def day_number(date):
+    """ Converts a date (a "%Y-%m-%d" string, datetime or datetime64) into
+        the day number since the epoch stored in the date columns.
+    """
+    
+    if isinstance(date, basestring):
+        date = datetime.datetime.strptime(date.strip(), "%Y-%m-%d")
+    return int(np.array([date], dtype='M8[D]').astype(np.int64)[0])
+
+
+def _decode_prices(recs):
+    """ Converts fetched stocks rows into a price_data.schema array. """
+
+    return np.array(recs, dtype=db_schema).view(price_data.schema)
+
+
+def _create_tables(conn):
+    """ Creates the tables and indexes of the current schema on conn. """
+
+    conn.execute('''CREATE TABLE stocks (symbol text, date integer, open float, high float, low float, close float, volume float, adjclose float)''')
+    conn.execute('''CREATE UNIQUE INDEX stock_idx ON stocks (symbol, date)''')
+    conn.execute('''CREATE TABLE symbol_list (symbol text, startdate integer, enddate integer, entries long)''')
+    conn.execute('''CREATE UNIQUE INDEX symbols_idx ON symbol_list (symbol)''')
+    _create_data_version(conn)
+    conn.execute("PRAGMA user_version = %d;" % SCHEMA_VERSION)
+
+
+def _create_data_version(conn):
+    """ Creates the single row data_version table on conn. """
+
+    conn.execute('''CREATE TABLE data_version (token text, version integer)''')
+    conn.execute("INSERT INTO data_version VALUES (?, 0);",
+                 (uuid.uuid4().hex,))
+    
+    
 def create_db(filename="test.db"):
     """ Creates database with schema to hold stock data."""
     
     if os.path.exists(filename):
         raise IOError
     
-    conn = sqlite3.connect(filename, 
-        detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
-    conn.execute('''CREATE TABLE stocks (symbol text, date datetime, open float, high float, low float, close float, volume float, adjclose float)''')
-    conn.execute('''CREATE UNIQUE INDEX stock_idx ON stocks (symbol, date)''')
-    conn.execute('''CREATE TABLE symbol_list (symbol text, startdate datetime, enddate datetime, entries long)''')
-    conn.execute('''CREATE UNIQUE INDEX symbols_idx ON symbol_list (symbol)''')
+    conn = sqlite3.connect(filename)
+    _create_tables(conn)
     conn.commit()
     conn.close()
     return
@@ -65,51 +236,155 @@ def save_to_db(data, dbfilename="data/stocks.db"):
     """ Utility function to save financial instrument price data to an SQLite
         database file."""
 
+    return save_many([data], dbfilename)
+
+
+def save_many(arrays, dbfilename="data/stocks.db"):
+    """ Saves a batch of price data arrays (e.g. one per symbol) to an
+        SQLite database file in a single transaction.  Records for a
+        (symbol, date) already in the database replace the existing ones.
+        Returns the number of records written.  Raises IOError if the file
+        uses an older schema version (see migrate_db).
+    """
+
     if not os.path.exists(dbfilename):
         create_db(dbfilename)
 
-    conn = sqlite3.connect(dbfilename,
-        detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
+    conn = _connect(dbfilename)
     c = conn.cursor()
+    sql = "INSERT OR REPLACE INTO stocks (symbol, date, open, high, low, close, volume, adjclose) VALUES (?, ?, ?, ?, ?, ?, ?, ?);"
+    symbols = set()
 
-    # Wrap in a try block in case there's a duplicate given our UNIQUE INDEX
-    #     criteria above.
-    try:
-        sql = "INSERT INTO stocks (symbol, date, open, high, low, close, volume, adjclose) VALUES (?, ?, ?, ?, ?, ?, ?, ?);"
-        
-        c.executemany(sql, data.tolist())
-    except sqlite3.IntegrityError:
-        pass
+    for data in arrays:
+        days = data['date'].astype('M8[D]').astype(np.int64)
+        rows = zip(data['symbol'].tolist(), days.tolist(),
+                   *[data[fld].tolist() for fld in panel_fields])
+        c.executemany(sql, rows)
+        symbols.update(data['symbol'].tolist())
 
-    conn.commit()
     change_count = conn.total_changes
+
+    # Keep the summary table current for the symbols written, and mark the
+    #   file as changed
+    _update_symbol_list(conn, symbols)
+    conn.execute("UPDATE data_version SET version = version + 1;")
+    conn.commit()
     c.close()
     conn.close()
+
+    # Cached histories of the symbols written are now stale
+    price_cache.invalidate(sorted(symbols), dbfilename)
     return change_count
 
 
-def load_from_db(symbol, startdate, enddate, dbfilename="data/stocks.db"):
-    """ Convenience function to pull data out of our price database. """
+def load_from_db(symbol, startdate, enddate, dbfilename="data/stocks.db",
+                 cache=True):
+    """ Convenience function to pull data out of our price database.  With
+        cache set, the data is served from (and, on first use, exported to)
+        the memory-mapped price_cache next to the database file.
+    """
     
-    # TODO: This is convoluted and, most-likely, quite slow... fix later
-    dt = np.dtype('M8[D]')
-    startdate = time.mktime(np.array([startdate], dtype=dt).tolist()[0].timetuple())
-    enddate = time.mktime(np.array([enddate], dtype=dt).tolist()[0].timetuple())
+    if cache:
+        columns = load_columns(symbol, startdate, enddate, dbfilename)
+        table = np.empty(len(columns['date']), dtype=price_data.schema)
+        table['symbol'] = symbol
+        for fld in ['date'] + panel_fields:
+            table[fld] = columns[fld]
+        return table
     
-    conn = sqlite3.connect(dbfilename, 
-        detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
-    sql = "SELECT symbol, date as 'date [datetime]', open, high, low, " \
-          "close, volume, adjclose from stocks where symbol='%s' and " \
-          "date>=%s and  date<=%s" % (symbol, startdate, enddate)
-    qry = conn.execute(sql)
+    conn = get_connection(dbfilename)
+    sql = "SELECT symbol, date, open, high, low, close, volume, adjclose " \
+          "from stocks where symbol=? and date>=? and date<=? order by date"
+    qry = conn.execute(sql, (symbol, day_number(startdate),
+                             day_number(enddate)))
     recs = qry.fetchall()
 
-    table = np.array(recs, dtype=price_data.schema)
+    table = _decode_prices(recs)
     
     return table
     
     
-def populate_db(symbols, startdate, enddate, dbfilename):
+def load_columns(symbol, startdate, enddate, dbfilename="data/stocks.db"):
+    """ Returns a dict of 'date' and panel_fields arrays for symbol between
+        startdate and enddate.  The arrays are read-only slices of the
+        memory-mapped price_cache, which is filled from the database the
+        first time a symbol is requested at the current data_version.
+    """
+    
+    # Taken before the query: if a save commits while this loads, the entry
+    #   is stored under the older version, and later loads miss it rather
+    #   than see stale data
+    version = data_version(dbfilename)
+    columns = price_cache.load_symbol(symbol, dbfilename, version)
+    if columns is None:
+        sql = "SELECT symbol, date, open, high, low, close, volume, " \
+              "adjclose from stocks where symbol=? order by date"
+        table = _decode_prices(get_connection(dbfilename).execute(sql,
+                                                    (symbol,)).fetchall())
+        try:
+            columns = price_cache.store_symbol(symbol, table, dbfilename,
+                                               version)
+        except (IOError, OSError):
+            # Can't write next to the database, serve straight from the query
+            columns = None
+        if columns is None:
+            columns = dict((fld, table[fld]) for fld in ['date']+panel_fields)
+    
+    dts = range_slice(columns['date'],
+                      np.datetime64(day_number(startdate), 'D'),
+                      np.datetime64(day_number(enddate), 'D'))
+    return dict((fld, col[dts]) for fld, col in columns.items())
+    
+    
+def load_many(symbols, startdate, enddate, dbfilename="data/stocks.db"):
+    """ Pulls the data for many symbols at once, returning a PricePanel
+        of every date any of the symbols has data for.
+        
+        Parameters:
+        symbols: list of strings, symbols to load.  Column order in the
+            returned panel follows this list (duplicates are dropped).
+        startdate: string, a date string representing the beginning date
+            for the requested data.
+        enddate: string, a date string representing the ending date for the 
+            requested data.
+    """
+    
+    symbollist = []
+    for symbol in symbols:
+        if symbol not in symbollist:
+            symbollist.append(symbol)
+    
+    conn = get_connection(dbfilename)
+    dates = (day_number(startdate), day_number(enddate))
+    
+    recs = []
+    for i in range(0, len(symbollist), MAX_QUERY_SYMBOLS):
+        chunk = symbollist[i:i+MAX_QUERY_SYMBOLS]
+        sql = "SELECT symbol, date, open, high, low, close, volume, " \
+              "adjclose from stocks where symbol IN (%s) and date>=? and " \
+              "date<=?" % ",".join("?"*len(chunk))
+        recs.extend(conn.execute(sql, tuple(chunk) + dates).fetchall())
+    
+    table = _decode_prices(recs)
+    
+    # Map each record onto its (date, symbol) cell in the panel
+    paneldates, rows = np.unique(table['date'], return_inverse=True)
+    order = np.array(symbollist, dtype=table.dtype['symbol'])
+    sorter = order.argsort()
+    cols = sorter[order.searchsorted(table['symbol'], sorter=sorter)]
+    
+    fields = {}
+    for fld in panel_fields:
+        values = np.empty((len(paneldates), len(symbollist)), dtype=float)
+        values.fill(np.nan)
+        values[rows, cols] = table[fld]
+        fields[fld] = values
+        
+    return PricePanel(symbollist, paneldates, fields)
+    
+    
+def populate_db(symbols, startdate, enddate, dbfilename, workers=8,
+                rate=price_data.request_rate, **kw):
     """ Wrapper function to rifle through a list of symbols, pull the data,
         and store it in a sqlite database file.
         
@@ -121,9 +396,11 @@ def populate_db(symbols, startdate, enddate, dbfilename):
             for the requested data.
         enddate: string, a date string representing the ending date for the 
             requested data.
+        workers: number of concurrent downloads.
+        rate: maximum requests per second to the price server, or None for
+            no limit.
+        Any other keywords are passed on to price_fetch.download_prices.
     """
-    save_count = 0
-    rec_count = 0
     if isinstance(symbols, str):
         # Try loading list from a file
         reader = csv.reader(open(symbols))
@@ -142,46 +419,86 @@ def populate_db(symbols, startdate, enddate, dbfilename):
     else:
         symbollist = set(symbols)
     
-    tot = float(len(symbollist))
-    count=0.0
     print "loading data ..."
-    for symbol in list(symbollist):
-        data = price_data.get_yahoo_prices(symbol, startdate, enddate)
-        num_saved = save_to_db(data, dbfilename)
-        count+=1.0
-        if num_saved:
-            save_count+=1
-            rec_count+=num_saved
-        # Give some indication of progress at the command line
-        print symbol + "",
-        sys.stdout.flush()
+    rec_count, saved, failed = price_fetch.download_prices(list(symbollist),
+                                        startdate, enddate, dbfilename,
+                                        workers=workers, rate=rate,
+                                        verbose=True, **kw)
+    save_count = len(saved)
 
     print "Saved %s records for %s out of %s symbols" % (rec_count,
                                                          save_count,
                                                          len(symbollist))
-    print "Populating symbol table..."
-
-    populate_symbol_list(dbfilename)
+    if failed:
+        print "Failed to load: %s" % " ".join(sorted(failed))
     
     
+def refresh_db(dbfilename="data/stocks.db", enddate=None, symbols=None,
+               workers=8, rate=price_data.request_rate, **kw):
+    """ Incremental update of the price data for the symbols in the
+        symbol_list table: only data newer than each symbol's enddate is
+        downloaded, then saved over any existing records (which also updates
+        the symbol_list entries).
+
+        Parameters:
+        enddate: string, a date string representing the ending date for the
+            requested data.  Defaults to yesterday.
+        symbols: optional list of strings to limit the refresh to
+        workers: number of concurrent downloads.
+        rate: maximum requests per second to the price server, or None for
+            no limit.
+        Any other keywords are passed on to price_fetch.download_prices.
+
+        Returns:
+        tuple of (number of records saved, list of symbols with new data,
+        dict of failed symbols to the exception raised fetching them)
+    """
+
+    if enddate is None:
+        enddate = (datetime.date.today() - datetime.timedelta(1)).isoformat()
+
+    table = load_symbols_from_table(dbfilename)
+    if symbols is not None:
+        table = table[np.in1d(table['symbol'], symbols)]
+
+    # Group symbols by the first date they need, one download per group
+    starts = {}
+    for symbol, lastdate in zip(table['symbol'].tolist(),
+                                table['enddate'] + np.timedelta64(1, 'D')):
+        starts.setdefault(str(lastdate), []).append(symbol)
+
+    rec_count = 0
+    refreshed = []
+    failed = {}
+    for startdate in sorted(starts):
+        if day_number(startdate) > day_number(enddate):
+            # Already up to date
+            continue
+        count, saved, errors = price_fetch.download_prices(starts[startdate],
+                                        startdate, enddate, dbfilename,
+                                        workers=workers, rate=rate, **kw)
+        rec_count += count
+        refreshed.extend(saved)
+        failed.update(errors)
+
+    return rec_count, refreshed, failed
+
+
 def symbol_exists(symbol, dbfilename="data/stocks.db"):
     """ Check for existence of symbol in specified dbfilename.  Returns a 
         tuple of how many records, and the start and end dates of the data
         available for the symbol.
     """
     
-    conn = sqlite3.connect(dbfilename, 
-        detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
-    sql = "SELECT symbol, date as 'date [datetime]' from stocks where symbol='%s';" % (symbol)
-    qry = conn.execute(sql)
-    recs = qry.fetchall()
-    schema = np.dtype({'names':['symbol', 'date'],
-                       'formats':['S8', 'M8[D]']})
-    table = np.array(recs, dtype=schema)
-
-    startdate = np.datetime64(table['date'][0])
-    enddate = np.datetime64(table['date'][-1])
-    return len(table), startdate, enddate
+    conn = get_connection(dbfilename)
+    sql = "SELECT COUNT(*), MIN(date), MAX(date) from stocks where symbol=?;"
+    entries, startdate, enddate = conn.execute(sql, (symbol,)).fetchone()
+    if not entries:
+        raise IndexError("No data for %s in %s" % (symbol, dbfilename))
+
+    startdate = np.datetime64(startdate, 'D')
+    enddate = np.datetime64(enddate, 'D')
+    return entries, startdate, enddate
     
 
 def all_symbols(dbfilename="data/stocks.db"):
@@ -189,9 +506,8 @@ def all_symbols(dbfilename="data/stocks.db"):
         database.
     """
     
-    conn = sqlite3.connect(dbfilename, 
-        detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
-    sql = "SELECT DISTINCT symbol from stocks;"
+    conn = get_connection(dbfilename)
+    sql = "SELECT symbol from symbol_list;"
     qry = conn.execute(sql)
     recs = qry.fetchall()
     reclist = [list(rec)[0] for rec in recs]
@@ -201,61 +517,129 @@ def load_symbols_from_table(dbfilename="data/stocks.db"):
     """ Should be same as all_symbols function and symbol_exists combined,
         but pulling from cached data in table.
     """
-    conn = sqlite3.connect(dbfilename,
-        detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
-    sql = "SELECT symbol, startdate as 'startdate [datetime]', enddate as 'enddate [datetime]', entries from symbol_list;"
+    conn = get_connection(dbfilename)
+    sql = "SELECT symbol, startdate, enddate, entries from symbol_list;"
     qry = conn.execute(sql)
     recs = qry.fetchall()
-    dt = np.dtype({'names':['symbol', 'startdate', 'enddate', 'entries'],
-                   'formats':['S8', 'M8[D]', 'M8[D]', long]})
-    return np.array(recs, dtype=dt)
+    return np.array(recs, dtype=db_symbol_list_schema).view(symbol_list_schema)
 
 
 def populate_symbol_list(dbfilename="data/stocks.db", symbols=None):
     """ Function to prepopulate a table with symbols where we don't have
-        to hammer the db every time.
-        Returns the number of records added.
+        to hammer the db every time.  The entries for symbols (all symbols
+        if None) are rebuilt in one aggregate pass over the stocks table.
+        save_to_db keeps the table current, so this is only needed to
+        rebuild it.
+        Returns the number of records added or updated.
     """
 
     if not os.path.exists(dbfilename):
         create_db(dbfilename)
 
-    if symbols is None:
-        symbols = all_symbols(dbfilename=dbfilename)
+    conn = _connect(dbfilename)
+    _update_symbol_list(conn, symbols)
+    conn.commit()
+    change_count = conn.total_changes
+    conn.close()
+    return change_count
 
-    dt = np.dtype({'names':['symbol', 'startdate', 'enddate', 'entries'],
-                   'formats':['S8', 'M8[D]', 'M8[D]', long]})
-    data = []
 
-    for symbol in symbols:
-        entries, startdate, enddate = symbol_exists(symbol, dbfilename=dbfilename)
-        data.append((symbol, startdate, enddate, entries))
+def _update_symbol_list(conn, symbols=None):
+    """ Recomputes the symbol_list entries of symbols (all symbols if None)
+        from a single MIN/MAX/COUNT pass grouped by symbol, within the
+        current transaction on conn.
+    """
 
-    data = np.array(data, dtype=dt)
+    sql = "INSERT OR REPLACE INTO symbol_list (symbol, startdate, enddate, " \
+          "entries) SELECT symbol, MIN(date), MAX(date), COUNT(*) FROM stocks"
 
+    if symbols is None:
+        conn.execute("DELETE FROM symbol_list;")
+        conn.execute(sql + " GROUP BY symbol;")
+        return
+
+    symbols = list(symbols)
+    for i in range(0, len(symbols), MAX_QUERY_SYMBOLS):
+        chunk = symbols[i:i+MAX_QUERY_SYMBOLS]
+        conn.execute(sql + " WHERE symbol IN (%s) GROUP BY symbol;" % (
+                     ",".join("?"*len(chunk))), chunk)
+
+
+def migrate_db(dbfilename):
+    """ Brings a database file written with an older schema up to
+        SCHEMA_VERSION, converting the float seconds (or ISO date text) in
+        the date columns of a version 1 file into integer day numbers and
+        adding the data_version table.  The conversion runs in a single
+        transaction.  The symbol_list table is rebuilt from the migrated
+        data.
+        Returns the number of price records in the migrated file.
+    """
 
-    conn = sqlite3.connect(dbfilename,
-        detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
-    c = conn.cursor()
+    conn = sqlite3.connect(dbfilename, isolation_level=None)
+    version = schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        conn.close()
+        return 0
 
-    # Wrap in a try block in case there's a duplicate given our UNIQUE INDEX
-    #     criteria above.
     try:
-        sql = "INSERT INTO symbol_list (symbol, startdate, enddate, entries) VALUES (?, ?, ?, ?);"
+        conn.execute("BEGIN;")
+        if version < 2:
+            _migrate_dates(conn)
+        else:
+            _create_data_version(conn)
+            conn.execute("PRAGMA user_version = %d;" % SCHEMA_VERSION)
+        conn.execute("COMMIT;")
+    except:
+        conn.execute("ROLLBACK;")
+        conn.close()
+        raise
+
+    count = conn.execute("SELECT COUNT(*) FROM stocks;").fetchone()[0]
+    conn.close()
+    price_cache.clear(dbfilename)
+    return count
 
-        c.executemany(sql, data.tolist())
-    except sqlite3.IntegrityError:
-        pass
 
-    conn.commit()
-    change_count = conn.total_changes
-    c.close()
-    conn.close()
-    return change_count
+def _migrate_dates(conn):
+    """ Rebuilds the tables of a version 1 database at the current schema,
+        within the current transaction on conn.
+    """
+
+    # Day number for either a float seconds or an ISO text date.  Rounding
+    #   absorbs any local time zone offset the seconds were written with.
+    day = "CASE typeof(%(col)s) " \
+          "WHEN 'text' THEN CAST(julianday(%(col)s) - 2440587.5 AS INTEGER) " \
+          "ELSE CAST(ROUND(%(col)s/86400.0) AS INTEGER) END"
+
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table';")]
+
+    for table in ["stocks", "symbol_list"]:
+        if table in tables:
+            conn.execute("ALTER TABLE %s RENAME TO %s_v1;" % (table, table))
+    conn.execute("DROP INDEX IF EXISTS stock_idx;")
+    conn.execute("DROP INDEX IF EXISTS symbols_idx;")
+    _create_tables(conn)
+
+    if "stocks" in tables:
+        conn.execute("INSERT OR REPLACE INTO stocks SELECT symbol, %s, "
+                     "open, high, low, close, volume, adjclose FROM "
+                     "stocks_v1;" % (day % {'col':'date'}))
+        conn.execute("DROP TABLE stocks_v1;")
+    if "symbol_list" in tables:
+        conn.execute("DROP TABLE symbol_list_v1;")
+    _update_symbol_list(conn)
+
 
-        
 def main():
-    pass
+    """ Migrates the database files given on the command line, e.g.:
+        python price_db.py data/stocks.db data/bonds.db
+    """
+
+    for dbfilename in sys.argv[1:]:
+        count = migrate_db(dbfilename)
+        print "%s: %s records at schema version %s" % (dbfilename, count,
+                                                       SCHEMA_VERSION)
 
 
 if __name__ == '__main__':
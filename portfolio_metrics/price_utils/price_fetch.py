@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+price_fetch.py
+
+Concurrent download of price histories into a price database.  A bounded
+pool of fetcher threads pulls the csv data for each symbol (spacing out
+requests to each host and retrying failures), and a single writer thread
+saves what they fetch in batches, one transaction per batch.
+
+Copyright (c) 2011 Vaught Management, LLC.
+License: BSD
+"""
+
+# Standard library imports
+import Queue
+import socket
+import sys
+import threading
+import time
+import urllib2
+import urlparse
+
+# Local imports
+import price_data
+import price_db
+
+
+class RateLimiter(object):
+    """ Spaces out requests so that each host sees at most 'rate' requests
+        per second, across all of the threads sharing the limiter.  A rate
+        of None sets no limit.
+    """
+
+    def __init__(self, rate=price_data.request_rate):
+        self.interval = 1.0/rate if rate else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """ Blocks until a request to the host of url is allowed. """
+
+        if not self.interval:
+            return
+        host = urlparse.urlparse(url).netloc
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def fetch_prices(symbol, startdate, enddate, url_func=price_data.yahoo_url,
+                 limiter=None, retries=3, backoff=0.5, timeout=30.0):
+    """ Downloads and parses the price csv for symbol.
+
+        Parameters:
+        symbol: string, a valid financial instrument symbol
+        startdate, enddate: datetimes bounding the requested data
+        url_func: callable(symbol, startdate, enddate) returning the url
+            of the csv, price_data.yahoo_url by default.
+        limiter: optional RateLimiter shared between fetchers
+        retries: number of times to retry after a failed request.  Client
+            errors (4xx, e.g. an unknown symbol) are not retried.
+        backoff: seconds to wait before the first retry, doubling after
+            each further failure.
+
+        Returns:
+        numpy array in the price_data.schema dtype
+    """
+
+    url = url_func(symbol, startdate, enddate)
+
+    for attempt in range(retries+1):
+        if limiter is not None:
+            limiter.wait(url)
+        try:
+            filehandle = urllib2.urlopen(url, timeout=timeout)
+            try:
+                lines = filehandle.read().splitlines()
+            finally:
+                filehandle.close()
+            return price_data.parse_price_csv(lines, symbol)
+        except urllib2.HTTPError, e:
+            if 400 <= e.code < 500 or attempt == retries:
+                raise
+        except (urllib2.URLError, socket.error):
+            if attempt == retries:
+                raise
+        time.sleep(backoff * 2**attempt)
+
+
+class PriceWriter(threading.Thread):
+    """ Single thread saving fetched price arrays to the database.  Arrays
+        put on the queue are written in batches of up to batch_size, each
+        batch in one transaction.  Put None on the queue to finish.
+        saved lists the symbols of the arrays committed so far.
+    """
+
+    def __init__(self, dbfilename, batch_size=50, **kw):
+        super(PriceWriter, self).__init__(**kw)
+        self.daemon = True
+        self.dbfilename = dbfilename
+        self.batch_size = batch_size
+        self.queue = Queue.Queue()
+        self.rec_count = 0
+        self.saved = []
+        self.error = None
+
+    def run(self):
+        done = False
+        while not done:
+            batch = [self.queue.get()]
+            # Pick up whatever else is already waiting
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            # Test for the sentinel by identity, comparing it with the
+            #   arrays would compare elementwise
+            if any(data is None for data in batch):
+                done = True
+                batch = [data for data in batch if data is not None]
+            if batch and self.error is None:
+                try:
+                    self.rec_count += price_db.save_many(batch,
+                                                         self.dbfilename)
+                    self.saved.extend(str(data['symbol'][0]) for data in batch)
+                except Exception, e:
+                    # Keep draining the queue so the fetchers don't block
+                    self.error = e
+
+
+def download_prices(symbols, startdate, enddate, dbfilename, workers=8,
+                    rate=price_data.request_rate, retries=3,
+                    url_func=price_data.yahoo_url,
+                    batch_size=50, datefmt="%Y-%m-%d", verbose=False):
+    """ Downloads the price data for symbols with a pool of fetcher threads
+        and saves it to dbfilename through a single writer thread.
+
+        Parameters:
+        symbols: list of strings, symbols to download
+        startdate: string, a date string representing the beginning date
+            for the requested data.
+        enddate: string, a date string representing the ending date for the
+            requested data.
+        workers: number of fetcher threads
+        rate: maximum requests per second to each host (all the workers
+            together), or None for no limit
+        url_func: callable(symbol, startdate, enddate) returning the url
+            to fetch, so that other (or stand-in) sources can be used.
+        batch_size: maximum number of symbols saved per transaction
+
+        Returns:
+        tuple of (number of records saved, list of symbols whose data was
+        saved, dict of failed symbols to the exception raised fetching them)
+    """
+
+    startdate, enddate = price_data.parse_date_range(startdate, enddate,
+                                                      datefmt)
+    limiter = RateLimiter(rate)
+    writer = PriceWriter(dbfilename, batch_size)
+    writer.start()
+
+    tasks = Queue.Queue()
+    for symbol in symbols:
+        tasks.put(symbol)
+
+    failed = {}
+    lock = threading.Lock()
+
+    def fetch():
+        while True:
+            try:
+                symbol = tasks.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                data = fetch_prices(symbol, startdate, enddate, url_func,
+                                    limiter, retries)
+            except Exception, e:
+                with lock:
+                    failed[symbol] = e
+                continue
+            if len(data):
+                writer.queue.put(data)
+            if verbose:
+                # Give some indication of progress at the command line
+                print symbol + "",
+                sys.stdout.flush()
+
+    fetchers = [threading.Thread(target=fetch) for i in range(workers)]
+    for thread in fetchers:
+        thread.daemon = True
+        thread.start()
+    for thread in fetchers:
+        thread.join()
+
+    writer.queue.put(None)
+    writer.join()
+    if writer.error is not None:
+        raise writer.error
+
+    return writer.rec_count, writer.saved, failed
+
+
+#### EOF ##################################################################
@@ -8,6 +8,8 @@ Copyright (c) 2011 Vaught Management, LLC.
 License: BSD
 """
 
+import datetime
+
 import numpy as np
 import metrics
 
@@ -16,12 +18,23 @@ schema = np.dtype({'names':['symbol', 'date', 'open', 'high', 'low',
                        'close', 'volume', 'adjclose'],
                    'formats':['S8', 'M8', float, float, float, float,
                        float, float]})
+day_schema = np.dtype({'names':['symbol', 'date', 'open', 'high', 'low',
+                           'close', 'volume', 'adjclose'],
+                       'formats':['S8', 'M8[D]', float, float, float, float,
+                           float, float]})
 dummy_data = [("TEST", "2001-1-1", 100., 100., 100., 100., 100., 100.),
                   ("TEST", "2001-1-2", 101., 101., 101., 101., 101., 101.),
                   ("TEST", "2001-1-3",  99.,  99.,  99.,  99.,  99.,  99.),
                   ("TEST", "2001-1-4", 100., 100., 100., 100., 100., 100.),
                   ("TEST", "2001-1-5", 101., 101., 101., 101., 101., 101.),
                   ("TEST", "2001-1-8", 105., 105., 105., 105., 105., 105.)]
+
+
+def day_array(data=dummy_data):
+    """ Builds a day-resolution price array from the dummy data."""
+    recs = [(r[0], datetime.datetime.strptime(r[1], "%Y-%m-%d").date()) + r[2:]
+            for r in data]
+    return np.array(recs, dtype=day_schema)
                   
 def test_rate_array():
     """ simple test of pricearray in, ratearray out.
@@ -66,6 +79,80 @@ def test_annualized_adjusted_rate():
     np.testing.assert_almost_equal(aar, 2.6020844941637074)
     
     
+def test_rate_array_startprice():
+    """ An explicit startprice sets the first period's rate."""
+    pa = day_array()
+    ra = metrics.rate_array(pa, startprice=50.0)
+    np.testing.assert_almost_equal(ra['rate'][0], 1.0)
+    np.testing.assert_almost_equal(ra['rate'][1], 0.01)
+    np.testing.assert_array_equal(ra['date'], pa['date'])
+    
+    
+def test_rate_matrix():
+    """ Batched rates should match rate_array row by row."""
+    pa = day_array()
+    prices = np.vstack([pa['adjclose'], 2*pa['adjclose'], pa['close'][::-1]])
+    rm = metrics.rate_matrix(prices)
+    assert rm.shape == prices.shape
+    ra = metrics.rate_array(pa)
+    np.testing.assert_array_almost_equal(rm[0], ra['rate'])
+    np.testing.assert_array_almost_equal(rm[1], ra['rate'])
+    np.testing.assert_almost_equal(rm[2][1], 101./105. - 1)
+
+    
+def test_rolling_metrics():
+    """ Rolling metrics match the whole-window metrics on each window."""
+    rate_dt = np.dtype({'names':['date', 'rate'],
+                        'formats':['M8[D]', float]})
+    rs = np.random.RandomState(0)
+    n, window = 120, 21
+    ra = np.empty(n, dtype=rate_dt)
+    ba = np.empty(n, dtype=rate_dt)
+    ra['date'] = ba['date'] = np.datetime64("2001-01-01") + \
+        np.arange(n)*7//5
+    ba['rate'] = 0.01*rs.randn(n)
+    ra['rate'] = 0.0005 + 1.2*ba['rate'] + 0.005*rs.randn(n)
+    
+    rolled = [(metrics.rolling_volatility(ra, window), metrics.volatility),
+              (metrics.rolling_beta(ra, ba, window),
+               lambda w: metrics.beta(w, ba[i-window+1:i+1])),
+              (metrics.rolling_alpha(ra, ba, window),
+               lambda w: metrics.alpha(w, ba[i-window+1:i+1])),
+              (metrics.rolling_annualized_adjusted_rate(ra, 0.02, window),
+               lambda w: metrics.annualized_adjusted_rate(w, 0.02)),
+              (metrics.rolling_sharpe_ratio(ra, 0.02, window),
+               lambda w: metrics.sharpe_ratio(w, 0.02))]
+    for result, func in rolled:
+        np.testing.assert_array_equal(result['date'], ra['date'])
+        assert np.isnan(result['value'][:window-1]).all()
+        for i in [window-1, 50, n-1]:
+            np.testing.assert_almost_equal(result['value'][i],
+                                           func(ra[i-window+1:i+1]))
+
+    
+def test_regress_matrix():
+    """ Batched regression matches the per-series metrics."""
+    rate_dt = np.dtype({'names':['date', 'rate'],
+                        'formats':['M8[D]', float]})
+    rs = np.random.RandomState(1)
+    bench = np.zeros(50, dtype=rate_dt)
+    bench['rate'] = 0.01*rs.randn(50)
+    rates = np.array([0.001 + 0.8*bench['rate'] + 0.004*rs.randn(50),
+                      -0.5*bench['rate'] + 0.01*rs.randn(50)])
+    
+    fits = metrics.regress_matrix(rates, bench['rate'])
+    assert fits.shape == (2,)
+    for row, fit in zip(rates, fits):
+        ra = bench.copy()
+        ra['rate'] = row
+        np.testing.assert_almost_equal(fit['beta'], metrics.beta(ra, bench))
+        np.testing.assert_almost_equal(fit['beta_bb'],
+                                       metrics.beta_bb(ra, bench))
+        np.testing.assert_almost_equal(fit['alpha'], metrics.alpha(ra, bench))
+        np.testing.assert_almost_equal(fit['r2'],
+                                       np.corrcoef(row, bench['rate'])[0, 1]**2)
+    
+    
 if __name__ == '__main__':
     print "Please run using 'nosetests' from the command line."
     
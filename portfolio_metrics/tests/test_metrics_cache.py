@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+test_metrics_cache.py
+
+Copyright (c) 2011 Vaught Management, LLC.
+License: BSD
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from metrics_cache import MetricsCache, db_version
+from price_utils import price_data, price_db
+
+
+def test_lru_eviction():
+    """ The least recently used entry is dropped first."""
+    cache = MetricsCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+
+
+class TestDiskTier(object):
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def teardown(self):
+        price_db.close_connections()
+        shutil.rmtree(self.tmpdir)
+
+    def test_disk_tier(self):
+        """ Entries written to disk are found by a fresh cache."""
+        cachedir = os.path.join(self.tmpdir, "metrics")
+        key = (("x.db", 1.0, 10), "AAA", "2001-1-1", "2001-12-31",
+               "adjclose", 0.015, "IDX")
+        MetricsCache(cachedir=cachedir).put(key, {"beta": np.arange(3.)})
+
+        cache = MetricsCache(max_entries=1, cachedir=cachedir)
+        np.testing.assert_array_equal(cache.get(key)["beta"], [0., 1., 2.])
+        assert not cache.get(key)["beta"].flags.writeable
+        assert cache.get(key[:-1] + ("SPX",)) is None
+        cache.clear()
+        assert MetricsCache(cachedir=cachedir).get(key) is None
+
+    def test_db_version(self):
+        """ The version changes with every save, and for a new file."""
+        filename = os.path.join(self.tmpdir, "test.db")
+        assert db_version(filename)[1] is None
+        data = np.array([("AAA", "2001-01-02", 1., 1., 1., 1., 1., 1.)],
+                        dtype=price_data.schema)
+        price_db.save_to_db(data, filename)
+        version = db_version(filename)
+        assert db_version(filename) == version
+        price_db.save_to_db(data, filename)
+        assert db_version(filename) != version
+
+        price_db.close_connections()
+        os.remove(filename)
+        price_db.save_to_db(data, filename)
+        assert db_version(filename)[1] != version[1]
+
+
+# EOF ####################################################################
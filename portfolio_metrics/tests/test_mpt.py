@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+test_mpt.py
+
+Copyright (c) 2011 Vaught Management, LLC.
+License: BSD
+"""
+
+import itertools
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import frontier
+import metrics_cache
+import mpt
+from price_utils import price_data, price_db
+
+
+def test_align_dates():
+    """ Aligned data matches plain linear interpolation on the dates within
+        range, for single and batched fields.
+    """
+    olddates = np.array(["2001-01-02", "2001-01-03", "2001-01-05",
+                         "2001-01-08"], dtype='M8[D]')
+    newdates = np.array(["2001-01-01", "2001-01-03", "2001-01-04",
+                         "2001-01-06", "2001-01-08", "2001-01-09"],
+                        dtype='M8[D]')
+    olddata = np.array([[10., 11., 13., 16.], [1., 2., 3., 4.]])
+
+    old = olddates.astype(np.int64)
+    new = newdates.astype(np.int64)[1:5]
+
+    single = mpt.align_dates(olddates, olddata[0], newdates)
+    np.testing.assert_array_almost_equal(single,
+                                         np.interp(new, old, olddata[0]))
+
+    alignment = mpt.date_alignment(olddates, newdates)
+    batched = mpt.align_dates(olddates, olddata, newdates, alignment)
+    assert batched.shape == (2, 4)
+    np.testing.assert_array_almost_equal(batched[1],
+                                         np.interp(new, old, olddata[1]))
+    assert mpt.date_alignment(olddates, newdates) is alignment
+
+
+def test_solve_mean_variance():
+    """ Matches the closed form for two stocks, and respects bounds."""
+    e = np.array([0.10, 0.05])
+    C = np.array([[0.04, 0.0], [0.0, 0.01]])
+    rt = 0.2
+    x, count = mpt.solve_mean_variance(e, C, rt)
+    best = (rt*(e[0] - e[1])/2 + C[1, 1])/(C[0, 0] + C[1, 1])
+    np.testing.assert_array_almost_equal(x, [best, 1 - best])
+
+    x, count = mpt.solve_mean_variance(e, C, rt, lower=0.0,
+                                       upper=[0.25, 1.0])
+    np.testing.assert_array_almost_equal(x, [0.25, 0.75])
+
+    e = np.array([0.10, 0.08, 0.02])
+    C = np.array([[0.05, 0.01, 0.0], [0.01, 0.03, 0.0], [0.0, 0.0, 0.01]])
+    x, count = mpt.solve_mean_variance(e, C, 0.1, lower=0.1, upper=0.6)
+    assert abs(x.sum() - 1.0) < 1e-12
+    assert np.all(x >= 0.1 - 1e-12) and np.all(x <= 0.6 + 1e-12)
+    # Marginal utility is equal among the weights not at a bound
+    mu = e - 2*np.dot(C, x)/0.1
+    free = (x > 0.1 + 1e-9) & (x < 0.6 - 1e-9)
+    assert np.ptp(mu[free]) < 1e-8
+
+
+def price_records(symbol, dates, prices):
+    table = np.zeros(len(dates), dtype=price_data.schema)
+    table['symbol'] = symbol
+    table['date'] = np.array(dates, dtype='M8[D]')
+    for fld in ['open', 'high', 'low', 'close', 'adjclose']:
+        table[fld] = prices
+    table['volume'] = 1000.
+    return table
+
+
+class TestPortfolio(object):
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbfilename = os.path.join(self.tmpdir, "test.db")
+        days = ["2001-01-%02d" % day for day in range(2, 13)]
+        self.aaa = 10. + np.sin(np.arange(10.))
+        price_db.save_many([
+            price_records("IDX", days, np.linspace(100., 110., 11)),
+            # Has a gap on the 8th
+            price_records("AAA", days[:6] + days[7:], self.aaa),
+            # Starts later
+            price_records("BBB", days[2:],
+                          [20., 21., 20.5, 22., 23., 22.5, 24., 25., 24.])],
+            self.dbfilename)
+
+    def teardown(self):
+        price_db.close_connections()
+        shutil.rmtree(self.tmpdir)
+
+    def test_portfolio_panel(self):
+        """ Stocks are aligned on one panel and share the benchmark."""
+        p = mpt.Portfolio(["BBB", "AAA", "NONE"], startdate="2001-01-01",
+                          enddate="2001-01-31", dbfilename=self.dbfilename,
+                          bench="IDX")
+
+        assert p.symbols == ["AAA", "BBB"]
+        assert p.weights == {"AAA": 0.5, "BBB": 0.5}
+        aaa, bbb = p.stocks["AAA"], p.stocks["BBB"]
+        assert aaa.bench_data is bbb.bench_data
+        assert len(p.dates) == 9
+        np.testing.assert_array_equal(bbb.dates, p.dates)
+        np.testing.assert_array_equal(aaa.ratearray['date'], p.dates)
+        # The gap is imputed, and the original data kept for AAA
+        np.testing.assert_almost_equal(aaa.stock_prices[4],
+                                       self.aaa[5:7].mean())
+        assert len(aaa.stock_data_cache) == 10
+        assert bbb.stock_data_cache is None
+
+        stock = mpt.Stock("AAA", "2001-01-01", "2001-01-31",
+                          dbfilename=self.dbfilename, bench="IDX")
+        stock.impute_to(p.dates)
+        np.testing.assert_array_almost_equal(aaa.ratearray['rate'],
+                                             stock.ratearray['rate'])
+        np.testing.assert_almost_equal(aaa.beta, stock.beta)
+        np.testing.assert_almost_equal(aaa.annual_volatility,
+                                       stock.annual_volatility)
+
+    def test_metrics_cache(self):
+        """ Rebuilding over unchanged data reuses the cached results."""
+        cache = metrics_cache.MetricsCache()
+        args = (["AAA", "BBB"], "equal", "2001-01-01", "2001-01-31",
+                self.dbfilename, "IDX")
+        p = mpt.Portfolio(*args, cache=cache)
+        again = mpt.Portfolio(*args, cache=cache)
+        assert again.stocks["AAA"] is not p.stocks["AAA"]
+        assert again.stocks["AAA"].ratearray is p.stocks["AAA"].ratearray
+        assert again.stocks["BBB"].beta == p.stocks["BBB"].beta
+
+        # Cached arrays can't be changed through the stocks sharing them
+        try:
+            again.stocks["AAA"].ratearray['rate'][0] = 1.0
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("cached rates should be read-only")
+
+        stock = mpt.Stock("AAA", "2001-01-01", "2001-01-31", self.dbfilename,
+                          "IDX", cache=cache)
+        assert len(cache) == 2
+        again = mpt.Stock("AAA", "2001-01-01", "2001-01-31", self.dbfilename,
+                          "IDX", cache=cache)
+        np.testing.assert_array_equal(again.ratearray, stock.ratearray)
+        assert not again.ratearray.flags.writeable
+        assert stock.ratearray.flags.writeable
+        # The stock the entry was made from can't change it either
+        stock.ratearray['rate'][:] = 99.
+        assert np.all(again.ratearray['rate'] != 99.)
+        assert mpt.Stock("AAA", "2001-01-01", "2001-01-31", self.dbfilename,
+                         "IDX", cache=cache).ratearray is again.ratearray
+
+        # Saving to the db makes for a new version of it, even when the
+        #   file keeps its size and modification time
+        stat = os.stat(self.dbfilename)
+        price_db.save_many([price_records("AAA", ["2001-01-03"], [10.5])],
+                           self.dbfilename)
+        os.utime(self.dbfilename, (stat.st_atime, stat.st_mtime))
+        assert os.stat(self.dbfilename).st_size == stat.st_size
+        again = mpt.Portfolio(*args, cache=cache)
+        assert again.stocks["AAA"].ratearray is not p.stocks["AAA"].ratearray
+        assert again.stocks["AAA"].stock_data_cache['adjclose'][1] == 10.5
+
+    def test_market_cache(self):
+        """ Covariance is computed once and refreshed when a stock changes."""
+        p = mpt.Portfolio(["AAA", "BBB"], startdate="2001-01-01",
+                          enddate="2001-01-31", dbfilename=self.dbfilename,
+                          bench="IDX")
+        cov = p.covariance
+        assert p.covariance is cov
+        np.testing.assert_array_almost_equal(cov, np.cov(p.rates))
+        assert p.expected_returns[1] == \
+            p.stocks["BBB"].annualized_adjusted_return
+
+        p.stocks["AAA"].impute_to(p.dates[2:])
+        p.stocks["BBB"].impute_to(p.dates[2:])
+        assert p.covariance is not cov
+        assert p.rates.shape == (2, 7)
+
+        # Another process (e.g. one loading these stocks from the disk tier
+        #   of the metrics cache) numbering its versions the same way
+        #   doesn't match them
+        old = (mpt._data_version_token, mpt._data_versions)
+        mpt._data_version_token = "another process"
+        mpt._data_versions = itertools.count(
+            p.stocks["AAA"].data_version[1])
+        try:
+            p.stocks["AAA"].impute_to(p.dates[3:])
+            p.stocks["BBB"].impute_to(p.dates[3:])
+            assert p.rates.shape == (2, 6)
+        finally:
+            mpt._data_version_token, mpt._data_versions = old
+
+    def test_optimize_qp(self):
+        """ The qp engine does at least as well as the swap heuristic."""
+        p = mpt.Portfolio(["AAA", "BBB", "IDX"], startdate="2001-01-01",
+                          enddate="2001-01-31", dbfilename=self.dbfilename,
+                          bench="IDX")
+
+        def utility(weights, rt):
+            x = np.array([weights[symbol] for symbol in p.symbols])
+            e = np.array([p.stocks[symbol].annualized_adjusted_return
+                          for symbol in p.symbols])
+            rates = np.array([p.stocks[symbol].ratearray['rate']
+                              for symbol in p.symbols])
+            return np.dot(e, x) - np.dot(x, np.dot(np.cov(rates), x))/rt
+
+        for rt in [0.001, 0.01]:
+            sharpe = p.optimize_portfolio(rt, 0.0, 1.0)
+            # The optimizer state shares the portfolio's arrays
+            assert isinstance(p.port_opt, mpt.OptimizationState)
+            assert p.port_opt.covariance is p.covariance
+            variance, ret = p.port_opt.evaluate_holdings()
+            np.testing.assert_almost_equal(ret, np.dot(p.expected_returns,
+                                                       p.port_opt.x))
+            p.port_opt = None
+            qp = p.optimize_portfolio(rt, 0.0, 1.0, method="qp")
+            p.port_opt = None
+            assert sorted(qp.keys()) == p.symbols
+            np.testing.assert_almost_equal(sum(qp.values()), 1.0)
+            assert utility(qp, rt) >= utility(sharpe, rt) - 1e-9
+
+    def test_efficient_frontier(self):
+        """ Pooled frontier matches optimizing each point in turn."""
+        p = mpt.Portfolio(["AAA", "BBB", "IDX"], startdate="2001-01-01",
+                          enddate="2001-01-31", dbfilename=self.dbfilename,
+                          bench="IDX")
+        rtrange = np.linspace(0.0005, 0.02, 8)
+        efx, efy, allocations = frontier.efficient_frontier(p, rtrange,
+            0.1, 1.0, processes=2)
+
+        assert len(efx) == len(efy) == len(allocations) == 8
+        for i, rt in enumerate(rtrange):
+            weights = p.optimize_portfolio(rt, 0.1, 1.0, method="qp")
+            for symbol in p.symbols:
+                np.testing.assert_almost_equal(
+                    allocations[i][symbol], weights[symbol])
+            np.testing.assert_almost_equal(efx[i], p.port_opt.volatility)
+            np.testing.assert_almost_equal(efy[i], p.port_opt.portfolio_return)
+            p.port_opt = None
+
+    def test_frontier_bounds(self):
+        """ A lower bound more weights can't meet is loosened to 1/n."""
+        p = mpt.Portfolio(["AAA", "BBB", "IDX"], startdate="2001-01-01",
+                          enddate="2001-01-31", dbfilename=self.dbfilename,
+                          bench="IDX")
+        rtrange = np.linspace(0.0005, 0.02, 4)
+        for mode in ["pool", "trace"]:
+            efx, efy, allocations = frontier.efficient_frontier(p, rtrange,
+                0.5, 1.0, processes=1, mode=mode)
+            assert len(allocations) == 4
+            for weights in allocations:
+                for symbol in p.symbols:
+                    np.testing.assert_almost_equal(weights[symbol], 1/3.)
+
+        lower, upper = frontier.feasible_bounds(30, 0.1, 0.02)
+        np.testing.assert_almost_equal(lower, 1/30.)
+        np.testing.assert_almost_equal(upper, 1/30.)
+
+    def test_trace_frontier(self):
+        """ Warm started tracing agrees with the pool, in fewer steps."""
+        p = mpt.Portfolio(["AAA", "BBB", "IDX"], startdate="2001-01-01",
+                          enddate="2001-01-31", dbfilename=self.dbfilename,
+                          bench="IDX")
+        rtrange = np.linspace(0.0005, 0.02, 8)
+        pooled = frontier.efficient_frontier(p, rtrange, 0.0, 1.0,
+                                             processes=1)
+        traced = frontier.efficient_frontier(p, rtrange, 0.0, 1.0,
+                                             mode="trace")
+        np.testing.assert_array_almost_equal(traced[0], pooled[0])
+        np.testing.assert_array_almost_equal(traced[1], pooled[1])
+
+        e, C = p.expected_returns, p.covariance
+        x = previous = np.ones(3)/3
+        cold = warm = 0
+        for rt in rtrange:
+            cold += frontier.frontier_point(e, C, rt, 0.0, 1.0, x)[3]
+            point = frontier.frontier_point(e, C, rt, 0.0, 1.0, previous)
+            warm += point[3]
+            previous = point[0]
+        assert warm < cold
+
+        efx, efy, allocations = frontier.trace_frontier(p, rtrange, 0.0, 1.0,
+                                                        max_change=0.05)
+        assert len(efy) > len(rtrange)
+        assert np.all(np.diff(efy) >= -1e-12)
+
+        # Bisected points closer than the old rounded keys each keep
+        #   their allocation
+        efx, efy, allocations = frontier.trace_frontier(p, [0.0005, 0.0007],
+                                                        0.0, 1.0,
+                                                        max_change=1e-9,
+                                                        max_points=20)
+        assert len(efy) == 20
+        assert len(allocations) == len(efx) == len(efy)
+
+
+# EOF ####################################################################
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+test_price_db.py
+
+Copyright (c) 2011 Vaught Management, LLC.
+License: BSD
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+import numpy as np
+from price_utils import price_cache, price_data, price_db
+
+dummy_data = [("AAA", "2001-01-02", 10., 11., 9., 10., 1000., 10.),
+              ("AAA", "2001-01-03", 11., 12., 10., 11., 1100., 11.),
+              ("AAA", "2001-01-04", 12., 13., 11., 12., 1200., 12.),
+              ("BBB", "2001-01-03", 20., 21., 19., 20., 2000., 20.),
+              ("BBB", "2001-01-05", 21., 22., 20., 21., 2100., 21.)]
+
+
+class TempDB(object):
+    """ Scratch directory for a test database """
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbfilename = os.path.join(self.tmpdir, "test.db")
+
+    def teardown(self):
+        price_db.close_connections()
+        shutil.rmtree(self.tmpdir)
+
+
+class TestPriceDB(TempDB):
+
+    def setup(self):
+        super(TestPriceDB, self).setup()
+        data = np.array(dummy_data, dtype=price_data.schema)
+        price_db.save_to_db(data, self.dbfilename)
+
+    def test_load_from_db(self):
+        """ Dates round trip as day numbers."""
+        table = price_db.load_from_db("AAA", "2001-1-3", "2001-01-31",
+                                      dbfilename=self.dbfilename)
+        assert table.dtype == price_data.schema
+        np.testing.assert_array_equal(table['date'],
+            np.array(["2001-01-03", "2001-01-04"], dtype='M8[D]'))
+        np.testing.assert_array_equal(table['adjclose'], [11., 12.])
+
+    def test_load_many(self):
+        """ Panel is dense over the union of dates with NaN gaps."""
+        panel = price_db.load_many(["BBB", "AAA"], "2001-01-01", "2001-01-31",
+                                   dbfilename=self.dbfilename)
+        assert panel.symbols == ["BBB", "AAA"]
+        assert panel['adjclose'].shape == (4, 2)
+        np.testing.assert_array_equal(panel['volume'][:, 0],
+                                      [np.nan, 2000., np.nan, 2100.])
+        np.testing.assert_array_equal(panel['volume'][:, 1],
+                                      [1000., 1100., 1200., np.nan])
+        records = panel.records("AAA")
+        single = price_db.load_from_db("AAA", "2001-01-01", "2001-01-31",
+                                       dbfilename=self.dbfilename)
+        np.testing.assert_array_equal(records, single)
+
+    def test_load_many_missing(self):
+        """ Symbols with no data get an all-NaN column; duplicates are
+            dropped and loads split across queries line up.
+        """
+        old_max = price_db.MAX_QUERY_SYMBOLS
+        price_db.MAX_QUERY_SYMBOLS = 1
+        try:
+            panel = price_db.load_many(["ZZZ", "AAA", "BBB", "AAA"],
+                                       "2001-01-01", "2001-01-31",
+                                       dbfilename=self.dbfilename)
+        finally:
+            price_db.MAX_QUERY_SYMBOLS = old_max
+        assert panel.symbols == ["ZZZ", "AAA", "BBB"]
+        assert "ZZZ" in panel
+        assert "CCC" not in panel
+        assert np.isnan(panel['adjclose'][:, panel.column("ZZZ")]).all()
+        assert len(panel.records("ZZZ")) == 0
+        np.testing.assert_array_equal(panel['adjclose'][:, 2],
+                                      [np.nan, 20., np.nan, 21.])
+
+        panel = price_db.load_many(["ZZZ"], "2001-01-01", "2001-01-31",
+                                   dbfilename=self.dbfilename)
+        assert panel['adjclose'].shape == (0, 1)
+
+    def test_connection_pool(self):
+        """ A thread reuses its connection; other threads get their own."""
+        conn = price_db.get_connection(self.dbfilename)
+        assert price_db.get_connection(self.dbfilename) is conn
+        price_db.load_many(["AAA"], "2001-01-01", "2001-01-31",
+                           dbfilename=self.dbfilename)
+        assert price_db.get_connection(self.dbfilename) is conn
+
+        others = []
+        thread = threading.Thread(target=lambda: others.append(
+            price_db.get_connection(self.dbfilename)))
+        thread.start()
+        thread.join()
+        assert others and others[0] is not conn
+
+        price_db.close_connections()
+        assert price_db.get_connection(self.dbfilename) is not conn
+
+    def test_symbol_list(self):
+        """ symbol_list is kept current by save_to_db."""
+        symbols = price_db.load_symbols_from_table(self.dbfilename)
+        assert symbols['symbol'].tolist() == ["AAA", "BBB"]
+        assert symbols['entries'].tolist() == [3, 2]
+        assert symbols['startdate'][1] == np.datetime64("2001-01-03")
+        assert symbols['enddate'][1] == np.datetime64("2001-01-05")
+
+        new = np.array([("BBB", "2001-01-08", 22., 23., 21., 22., 2200., 22.)],
+                       dtype=price_data.schema)
+        price_db.save_to_db(new, self.dbfilename)
+        entries, startdate, enddate = price_db.symbol_exists("BBB",
+                                                             self.dbfilename)
+        assert entries == 3
+        assert enddate == np.datetime64("2001-01-08")
+        symbols = price_db.load_symbols_from_table(self.dbfilename)
+        assert symbols['entries'].tolist() == [3, 3]
+        assert symbols['enddate'][1] == enddate
+
+    def test_price_cache(self):
+        """ Cached reads match the db and are dropped by save_to_db."""
+        cached = price_db.load_from_db("AAA", "2001-01-01", "2001-01-31",
+                                       dbfilename=self.dbfilename)
+        assert price_cache.load_symbol("AAA", self.dbfilename) is not None
+        uncached = price_db.load_from_db("AAA", "2001-01-01", "2001-01-31",
+                                         dbfilename=self.dbfilename,
+                                         cache=False)
+        np.testing.assert_array_equal(cached, uncached)
+
+        columns = price_db.load_columns("AAA", "2001-01-03", "2001-01-03",
+                                        dbfilename=self.dbfilename)
+        assert isinstance(columns['adjclose'], np.memmap)
+        np.testing.assert_array_equal(columns['adjclose'], [11.])
+
+        new = np.array([("AAA", "2001-01-05", 13., 14., 12., 13., 1300., 13.)],
+                       dtype=price_data.schema)
+        price_db.save_to_db(new, self.dbfilename)
+        assert price_cache.load_symbol("AAA", self.dbfilename) is None
+        table = price_db.load_from_db("AAA", "2001-01-01", "2001-01-31",
+                                      dbfilename=self.dbfilename)
+        assert len(table) == 4
+
+    def test_price_cache_version(self):
+        """ Entries are only used at the data_version they were read at."""
+        version = price_db.data_version(self.dbfilename)
+        old = price_db.load_from_db("AAA", "2001-01-01", "2001-01-31",
+                                    dbfilename=self.dbfilename)
+        new = np.array([("AAA", "2001-01-05", 13., 14., 12., 13., 1300., 13.)],
+                       dtype=price_data.schema)
+        price_db.save_to_db(new, self.dbfilename)
+
+        # A load that read before the save stores its entry afterwards
+        price_cache.store_symbol("AAA", old, self.dbfilename, version)
+        assert price_cache.load_symbol("AAA", self.dbfilename,
+            price_db.data_version(self.dbfilename)) is None
+        table = price_db.load_from_db("AAA", "2001-01-01", "2001-01-31",
+                                      dbfilename=self.dbfilename)
+        assert len(table) == 4
+
+        # Entries for symbols not written are stale too once the version
+        #   moves on
+        bbb = price_db.load_from_db("BBB", "2001-01-01", "2001-01-31",
+                                    dbfilename=self.dbfilename)
+        conn = price_db.get_connection(self.dbfilename)
+        conn.execute("UPDATE stocks SET adjclose = 0. WHERE symbol = 'BBB'")
+        conn.execute("UPDATE data_version SET version = version + 1")
+        conn.commit()
+        table = price_db.load_from_db("BBB", "2001-01-01", "2001-01-31",
+                                      dbfilename=self.dbfilename)
+        assert len(table) == len(bbb)
+        assert np.all(table['adjclose'] == 0.)
+
+
+class TestMigrateDB(TempDB):
+
+    def test_migrate_db(self):
+        """ Version 1 float seconds dates become day numbers."""
+        conn = sqlite3.connect(self.dbfilename)
+        conn.execute("CREATE TABLE stocks (symbol text, date datetime, open float, high float, low float, close float, volume float, adjclose float)")
+        conn.execute("CREATE UNIQUE INDEX stock_idx ON stocks (symbol, date)")
+        conn.execute("CREATE TABLE symbol_list (symbol text, startdate datetime, enddate datetime, entries long)")
+        conn.execute("CREATE UNIQUE INDEX symbols_idx ON symbol_list (symbol)")
+        day = 11324 * 86400.
+        conn.executemany("INSERT INTO stocks VALUES (?, ?, 1., 1., 1., 1., 1., 1.)",
+                         [("AAA", day), ("AAA", day + 86400.),
+                          ("BBB", "2001-01-03")])
+        conn.execute("INSERT INTO symbol_list VALUES ('AAA', ?, ?, 2)",
+                     (day, day + 86400.))
+        conn.commit()
+        conn.close()
+
+        try:
+            price_db.load_from_db("AAA", "2001-01-01", "2001-01-31",
+                                  dbfilename=self.dbfilename)
+        except IOError:
+            pass
+        else:
+            raise AssertionError("old schema should not load")
+
+        new = np.array([("AAA", "2001-01-05", 1., 1., 1., 1., 1., 1.)],
+                       dtype=price_data.schema)
+        try:
+            price_db.save_to_db(new, self.dbfilename)
+        except IOError:
+            pass
+        else:
+            raise AssertionError("old schema should not be written to")
+
+        assert price_db.migrate_db(self.dbfilename) == 3
+
+        table = price_db.load_from_db("AAA", "2001-01-01", "2001-01-31",
+                                      dbfilename=self.dbfilename)
+        np.testing.assert_array_equal(table['date'],
+            np.array(["2001-01-02", "2001-01-03"], dtype='M8[D]'))
+        table = price_db.load_from_db("BBB", "2001-01-01", "2001-01-31",
+                                      dbfilename=self.dbfilename)
+        assert table['date'][0] == np.datetime64("2001-01-03")
+        symbols = price_db.load_symbols_from_table(self.dbfilename)
+        assert symbols['enddate'][0] == np.datetime64("2001-01-03")
+
+
+# EOF ####################################################################
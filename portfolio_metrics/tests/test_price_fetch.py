@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+test_price_fetch.py
+
+Exercises the concurrent downloader against a local stand-in for the price
+server that serves canned csv data.
+
+Copyright (c) 2011 Vaught Management, LLC.
+License: BSD
+"""
+
+import BaseHTTPServer
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import time
+import warnings
+
+import numpy as np
+from price_utils import price_db, price_fetch
+
+canned_csv = {"AAA": "Date,Open,High,Low,Close,Volume,Adj Close\n"
+                     "2001-01-03,11.0,12.0,10.0,11.0,1100,11.0\n"
+                     "2001-01-02,10.0,11.0,9.0,10.0,1000,10.0\n",
+              "BBB": "Date,Open,High,Low,Close,Volume,Adj Close\n"
+                     "2001-01-02,20.0,21.0,19.0,20.0,2000,20.0\n"}
+aaa_csv = canned_csv["AAA"]
+
+
+class CannedHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Serves /SYMBOL.csv from canned_csv.  The first request for BBB
+        fails with a server error to exercise the retries.
+    """
+
+    hits = {}
+
+    def do_GET(self):
+        symbol = self.path.strip("/").split(".")[0]
+        hits = self.hits[symbol] = self.hits.get(symbol, 0) + 1
+        if symbol == "BBB" and hits == 1:
+            self.send_error(503)
+        elif symbol in canned_csv:
+            self.send_response(200)
+            self.send_header("Content-type", "text/csv")
+            self.end_headers()
+            self.wfile.write(canned_csv[symbol])
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownloadPrices(object):
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbfilename = os.path.join(self.tmpdir, "test.db")
+        CannedHandler.hits = {}
+        self.requested = {}
+        self.server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0),
+                                                CannedHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def teardown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        price_db.close_connections()
+        shutil.rmtree(self.tmpdir)
+
+    def url(self, symbol, startdate, enddate):
+        self.requested[symbol] = startdate
+        return "http://127.0.0.1:%d/%s.csv" % (self.server.server_port,
+                                               symbol)
+
+    def test_download_prices(self):
+        """ Fetched data lands in the db, retrying server errors."""
+        count, saved, failed = price_fetch.download_prices(
+            ["AAA", "BBB", "NOPE"], "2001-01-01", "2001-01-31",
+            self.dbfilename, workers=3, rate=100., url_func=self.url)
+
+        assert count == 3
+        assert sorted(saved) == ["AAA", "BBB"]
+        assert failed.keys() == ["NOPE"]
+        assert CannedHandler.hits["BBB"] == 2
+        # Client errors aren't retried
+        assert CannedHandler.hits["NOPE"] == 1
+
+        table = price_db.load_from_db("AAA", "2001-01-01", "2001-01-31",
+                                      dbfilename=self.dbfilename)
+        np.testing.assert_array_equal(table['adjclose'], [10., 11.])
+
+    def test_populate_db(self):
+        """ populate_db passes the rate limit on; None sets no limit."""
+        price_db.populate_db(["AAA", "BBB"], "2001-01-01", "2001-01-31",
+                             self.dbfilename, workers=2, rate=None,
+                             url_func=self.url)
+        assert sorted(self.requested) == ["AAA", "BBB"]
+        symbols = price_db.load_symbols_from_table(self.dbfilename)
+        assert symbols['symbol'].tolist() == ["AAA", "BBB"]
+
+        limiter = price_fetch.RateLimiter(None)
+        start = time.time()
+        for i in range(100):
+            limiter.wait(self.url("AAA", None, None))
+        assert time.time() - start < 0.5
+
+    def test_price_writer(self):
+        """ The writer saves whole batches and reports only what it
+            committed.
+        """
+        parse = price_fetch.price_data.parse_price_csv
+        aaa = parse(canned_csv["AAA"].splitlines(), "AAA")
+        bbb = parse(canned_csv["BBB"].splitlines(), "BBB")
+
+        writer = price_fetch.PriceWriter(self.dbfilename, batch_size=10)
+        for data in [aaa, bbb, None]:
+            writer.queue.put(data)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            writer.run()
+        assert writer.error is None
+        assert writer.rec_count == 3
+        assert writer.saved == ["AAA", "BBB"]
+
+        # A failed batch is not reported as saved
+        writer = price_fetch.PriceWriter(os.path.join(self.tmpdir, "no",
+                                                      "such.db"))
+        for data in [aaa, None]:
+            writer.queue.put(data)
+        writer.run()
+        assert writer.error is not None
+        assert writer.saved == []
+
+    def test_refresh_db(self):
+        """ Refresh asks only for newer data and upserts it."""
+        price_fetch.download_prices(["AAA", "BBB"], "2001-01-01",
+            "2001-01-31", self.dbfilename, rate=100., url_func=self.url)
+        price_db.populate_symbol_list(self.dbfilename)
+
+        # New bar plus a revision of an existing one
+        canned_csv["AAA"] = ("Date,Open,High,Low,Close,Volume,Adj Close\n"
+                             "2001-01-04,12.0,13.0,11.0,12.0,1200,12.0\n"
+                             "2001-01-03,11.0,12.0,10.0,11.0,1100,10.5\n")
+        try:
+            count, refreshed, failed = price_db.refresh_db(self.dbfilename,
+                "2001-01-31", rate=100., url_func=self.url)
+        finally:
+            canned_csv["AAA"] = aaa_csv
+
+        assert self.requested["AAA"].date() == datetime.date(2001, 1, 4)
+        assert self.requested["BBB"].date() == datetime.date(2001, 1, 3)
+        assert count == 3
+        table = price_db.load_from_db("AAA", "2001-01-01", "2001-01-31",
+                                      dbfilename=self.dbfilename)
+        np.testing.assert_array_equal(table['adjclose'], [10., 10.5, 12.])
+
+        symbols = price_db.load_symbols_from_table(self.dbfilename)
+        aaa = symbols[symbols['symbol'] == "AAA"][0]
+        assert aaa['enddate'] == np.datetime64("2001-01-04")
+        assert aaa['entries'] == 3
+        assert len(symbols) == 2
+
+
+# EOF ####################################################################
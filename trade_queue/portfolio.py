@@ -10,11 +10,15 @@ License: BSD
 
 """
 
+# Standard library imports
+import bisect
+
 # Enthought imports
-from enthought.traits.api import (HasTraits, Float, Instance, List)
+from enthought.traits.api import (HasTraits, Any, Bool, Float, Instance, List,
+                                  on_trait_change)
 
 # Local imports
-from position import Position
+from position import Position, make_sort_key
 
 class Holding(HasTraits):
     """ Queue for held positions in the same security (as identified
@@ -26,12 +30,25 @@ class Holding(HasTraits):
     # Total quantity for a particular holding
     qty = Float
     
-    # List of positions making up the holding
+    # List of positions making up the holding, in sort_key order (and in
+    #   the order added for equal keys)
     positions = List(Instance(Position))
     
+    # The sort_key of each position, in step with positions so they can be
+    #   bisected; None when positions was changed from outside the holding
+    #   and needs sorting (see _sorted_keys)
+    _keys = Any
+    
+    # True while the holding changes positions itself
+    _updating = Bool(False)
+    
     def add_to(self, position):
         self.qty += position.qty
-        self.positions.append(position)
+        # Insert in order (after any equal keys), so removals never need
+        #   to sort
+        key = position.sort_key
+        self._insert(bisect.bisect_right(self._sorted_keys(), key), key,
+                     position)
         
     def remove_from(self, position, order="fifo"):
         """ given a position designated as a removal, adjust
@@ -51,6 +68,7 @@ class Holding(HasTraits):
                 how to do sorting of positions flexibly)
         """
         
+        self._sorted_keys()
         if order=='fifo':
             pos_idx = 0
         elif order=='lifo':
@@ -58,7 +76,6 @@ class Holding(HasTraits):
         elif order=='wifo':
             raise NotImplementedError
         
-        self.positions.sort()
         idx_pos = self.positions[pos_idx]
         idx_qty = idx_pos.qty
         
@@ -69,7 +86,7 @@ class Holding(HasTraits):
         if -position.qty == idx_qty:
             # Assume an opposite signed qty.
             self.qty += position.qty
-            del self.positions[pos_idx]
+            self._delete(pos_idx)
             
         # Second scenario: indicated qty is greater than the position entry
         #   qty next in the queue.  If so, adjust the qty total by the amount
@@ -81,7 +98,7 @@ class Holding(HasTraits):
 
             remaining = position.qty + idx_qty
             self.qty -= idx_qty
-            del self.positions[pos_idx]
+            self._delete(pos_idx)
             
             share_ratio = remaining/position.qty
             position.qty = remaining
@@ -103,6 +120,62 @@ class Holding(HasTraits):
             
         return
         
+    def _sorted_keys(self):
+        """ Returns _keys, first sorting positions (stably) if they were
+            assigned or changed from outside the holding.
+        """
+        if self._keys is None:
+            self._updating = True
+            try:
+                self.positions.sort()
+            finally:
+                self._updating = False
+            self._keys = [position.sort_key for position in self.positions]
+        return self._keys
+        
+    def _insert(self, index, key, position):
+        self._keys.insert(index, key)
+        self._updating = True
+        try:
+            self.positions.insert(index, position)
+        finally:
+            self._updating = False
+        
+    def _delete(self, index):
+        del self._keys[index]
+        self._updating = True
+        try:
+            del self.positions[index]
+        finally:
+            self._updating = False
+        
+    @on_trait_change("positions,positions_items")
+    def _positions_changed(self):
+        if not self._updating:
+            self._keys = None
+        
+    @on_trait_change("positions:trans_date")
+    def _trans_date_changed(self, position, name, old, new):
+        """ Moves a position whose trans_date was edited (e.g. through its
+            date_display) to its place for the new date.
+        """
+        if self._keys is None or self._updating:
+            return
+        old_key = make_sort_key(old)
+        lo = bisect.bisect_left(self._keys, old_key)
+        hi = bisect.bisect_right(self._keys, old_key)
+        for index in range(lo, hi):
+            if self.positions[index] is position:
+                self._delete(index)
+                break
+        else:
+            # Not where it should be, so sort it out on next use
+            self._keys = None
+            return
+        new_key = make_sort_key(new)
+        self._insert(bisect.bisect_right(self._keys, new_key), new_key,
+                     position)
+        
     def __repr__(self):
         """ Custom representation of holding object. """
         
@@ -15,7 +15,7 @@ from datetime import datetime
 
 # Enthought library imports
 from enthought.traits.api import (HasTraits, Enum, Float, Int,
-                                  Property, Regex, Str)
+                                  Property, Regex, Str, cached_property)
 from enthought.traits.ui.api import Item, View
 
 # Local library imports
@@ -47,6 +47,10 @@ class Position(HasTraits):
     filled = Str
     exchange = Str
     
+    # trans_date in integer microseconds; positions are ordered by it, and
+    #   a Holding keeps positions on the same date in the order added
+    sort_key = Property(depends_on='trans_date')
+    
     # The following traits are for viewing and editing the datetime value
     #     of trans_date (which is a float of seconds since the Epoch)
     date_display = Property(Regex(value='11/17/1969',
@@ -65,6 +69,10 @@ class Position(HasTraits):
     
     ###################################
     # Property methods
+    @cached_property
+    def _get_sort_key(self):
+        return make_sort_key(self.trans_date)
+    
     def _get_date_display(self):
         return dt_from_timestamp(self.trans_date, tz=Eastern).strftime("%m/%d/%Y")
         
@@ -93,11 +101,14 @@ class Position(HasTraits):
         return "<Position %s %s>" % (self.symbol, self.qty)
     
     # support reasonable sorting based on trans_date
-    def __cmp__(self, other):
-        if self.trans_date < other.trans_date:
-            return -1
-        elif self.trans_date > other.trans_date:
-            return 1
-        else: return 0
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
+
+
+def make_sort_key(trans_date):
+    """ Returns trans_date (seconds since the Epoch) as the int microseconds
+        positions are ordered by.
+    """
+    return int(round(trans_date*1e6))
 
 #### EOF ####################################################################
\ No newline at end of file
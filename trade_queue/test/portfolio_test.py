@@ -153,5 +153,29 @@ def portfolio_holding_lifo2_test():
     p = h.positions[0]
     assert p.price==185.25
     
+
+def portfolio_holding_order_test():
+    """ Positions stay in trans_date order when a date is edited or the
+        list is changed directly, with ties in the order added.
+    """
+    h = portfolio.Holding()
+    for i, date in enumerate([1053605468.54, 1021236990.02, 1053605468.54,
+                              1045623459.68]):
+        h.add_to(position.Position(symbol="AAPL", id=i, qty=100,
+                                   price=185.25, trans_date=date))
+    
+    assert [p.id for p in h.positions]==[1, 3, 0, 2]
+    
+    h.positions[0].trans_date = 1055902486.22
+    assert [p.id for p in h.positions]==[3, 0, 2, 1]
+    
+    h.positions.append(position.Position(symbol="AAPL", id=4, qty=100,
+                                         price=185.25,
+                                         trans_date=1000000000.0))
+    h.remove_from(position.Position(symbol="AAPL", id=5, qty=-100,
+                                    price=186.00, trans_date=1056000000.0),
+                  order='fifo')
+    assert [p.id for p in h.positions]==[3, 0, 2, 1]
+    
     
 #### EOF ####################################################################
\ No newline at end of file
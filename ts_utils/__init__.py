@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+__init__.py
+
+Time series and file helpers shared by the plotting apps (biz_cycles,
+commodities) and portfolio_metrics.
+
+Copyright (c) 2011 Vaught Consulting.
+License: BSD
+"""
+
+from csv_reader import iter_time_series_csv, read_time_series_from_csv
+from files import write_atomically
+from ranges import range_slice
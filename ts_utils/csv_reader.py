@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+csv_reader.py
+
+Loader for csv files of time series: a header line, a date column and
+columns of numbers.  Lines are read a chunk at a time and each column of a
+chunk is converted in one go into a preallocated record array, so the
+file never sits in memory as Python strings.  Dates are parsed once per
+distinct date string.
+
+read_time_series_from_csv also saves what it parses to a binary sidecar
+next to the csv file, e.g.
+
+    biz_cycles.csv.9b1e04c7a2d5.3f2a9c01d4e7.npy
+
+where the first hex digits identify the parsing options (local time zone
+included, as dates are converted in local time) and the second the csv
+file's modification time and size.  Later loads memory-map the sidecar
+instead of parsing the text again; a changed csv file or new options
+simply miss.  Each set of options keeps its own sidecar.
+
+Copyright (c) 2011 Vaught Consulting.
+License: BSD
+"""
+
+# Standard library imports
+import glob
+import hashlib
+import itertools
+import os
+import time
+
+# Major package imports
+import numpy as np
+
+# Local imports
+from files import write_atomically
+
+# Lines parsed at a time
+CHUNK_SIZE = 65536
+
+# Bump when the layout of the sidecar files changes
+SIDECAR_VERSION = 1
+
+
+class DateParser(object):
+    """ Converts date strings in date_format into seconds since the Epoch,
+        remembering the result for each distinct string.
+    """
+
+    def __init__(self, date_format):
+        self.date_format = date_format
+        self._seconds = {}
+
+    def __call__(self, text):
+        try:
+            return self._seconds[text]
+        except KeyError:
+            seconds = time.mktime(time.strptime(text, self.date_format))
+            self._seconds[text] = seconds
+            return seconds
+
+
+def _strip_quotes(tokens):
+    # make sure there are no "quotes" around the text; checked per token as
+    #   a column may be quoted on some lines and not on others
+    return [token.strip('"') if token[:1] == '"' else token
+            for token in tokens]
+
+
+def iter_time_series_csv(filename, dtype=['float32', 'float32', 'float32'],
+                         first_line_header=True, separator=',',
+                         date_col=None, date_format="%d/%b/%y",
+                         chunk_size=CHUNK_SIZE):
+    """ Reads a csv file of N columns as a sequence of record arrays of up
+        to chunk_size rows each, so files larger than memory can be
+        processed a block at a time.  Parameters are as for
+        read_time_series_from_csv.
+    """
+
+    with open(filename, 'r') as f:
+        rec_dtype = _read_dtype(f, dtype, first_line_header, separator)
+        names = rec_dtype.names
+
+        parse_date = DateParser(date_format)
+        # Line numbers in the file, for error messages
+        numbered = itertools.count(2 if first_line_header else 1)
+        while True:
+            # (the lines go first so a full chunk doesn't use up a number)
+            chunk = zip(itertools.islice(f, chunk_size), numbered)
+            if not chunk:
+                break
+
+            rows = []
+            for line, lineno in chunk:
+                line = line.strip()
+                if not line:
+                    continue
+                row = line.split(separator)
+                if len(row) != len(names):
+                    raise ValueError("%s, line %d: expected %d fields, "
+                                     "found %d" % (filename, lineno,
+                                                   len(names), len(row)))
+                rows.append(row)
+            if not rows:
+                continue
+
+            block = np.empty(len(rows), dtype=rec_dtype)
+            for i, column in enumerate(itertools.izip(*rows)):
+                column = _strip_quotes(column)
+                if i == date_col:
+                    block[names[i]] = [parse_date(text) for text in column]
+                else:
+                    block[names[i]] = np.array(column).astype(rec_dtype[i])
+            yield block
+
+
+def read_time_series_from_csv(filename, dtype=['float32', 'float32', 'float32'], first_line_header=True, separator=',', date_col=None, date_format="%d/%b/%y", sidecar=True):
+    """ Read a csv file of N columns.
+        Parameters:
+          - filename: string for file path and name.
+          - dtype: list of valid dtype codes to cast column values into
+          - first_line_header: True/False does the first line of the csv
+                contain header labels?
+          - separator: in case the csv file is "X"sv.
+          - date_col: special case for time series data to specify which col contains
+                text representing a date.
+          - date_format: normal python date string format codes for translating date
+                string into seconds since the Epoch
+          - sidecar: True/False load from, and save to, a binary copy of the
+                parsed data next to the csv file (read-only memory-mapped)
+    """
+
+    if sidecar:
+        key = [dtype, first_line_header, separator, date_col, date_format,
+               _local_zone()]
+        path = sidecar_path(filename, key)
+        try:
+            return np.load(path, mmap_mode='r').view(np.recarray)
+        except (IOError, OSError, ValueError):
+            pass
+
+    blocks = list(iter_time_series_csv(filename, dtype, first_line_header,
+                                       separator, date_col, date_format))
+    if len(blocks) == 1:
+        data = blocks[0]
+    elif blocks:
+        data = np.concatenate(blocks)
+    else:
+        with open(filename, 'r') as f:
+            data = np.empty(0, dtype=_read_dtype(f, dtype, first_line_header,
+                                                 separator))
+
+    if sidecar:
+        _save_sidecar(filename, path, data)
+    return data.view(np.recarray)
+
+
+def sidecar_path(filename, options):
+    """ Returns the path of the binary sidecar for the current version of
+        filename parsed with options (a list of the parsing parameters).
+    """
+
+    stat = os.stat(filename)
+    return "%s.%s.%s.npy" % (filename, _digest(options),
+                             _digest((SIDECAR_VERSION, stat.st_mtime,
+                                      stat.st_size)))
+
+
+def _digest(key):
+    return hashlib.sha1(repr(key)).hexdigest()[:12]
+
+
+def _local_zone():
+    """ Identifies the local time zone that time.mktime converts dates in. """
+    return (os.environ.get("TZ"), time.tzname, time.timezone, time.altzone)
+
+
+def _save_sidecar(filename, path, data):
+    """ Writes data to path, replacing the sidecars for older versions of
+        filename parsed with the same options.  Failing to write (e.g. a
+        read-only directory) is not an error, the data just gets parsed
+        again next time.
+    """
+
+    try:
+        # path is <filename>.<options>.<version>.npy
+        prefix = path.rsplit(".", 2)[0]
+        for old in glob.glob(prefix + ".*.npy"):
+            os.remove(old)
+        write_atomically(path, lambda f: np.save(f, data))
+    except (IOError, OSError):
+        pass
+
+
+def _read_dtype(f, dtype, first_line_header, separator):
+    """ Builds the record dtype, reading the column names from the header
+        line of the open file f if there is one.
+    """
+    if first_line_header:
+        names = _strip_quotes(f.readline().strip().split(separator))
+    else:
+        names = ['f%d' % i for i in range(len(dtype))]
+    return np.dtype([(name, dtype[i]) for i, name in enumerate(names)])
+
+
+#### EOF ####################################################################
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+files.py
+
+Writing cache files that other processes may be reading.
+
+Copyright (c) 2011 Vaught Consulting.
+License: BSD
+"""
+
+# Standard library imports
+import os
+import shutil
+import tempfile
+
+
+def write_atomically(path, write, directory=False):
+    """ Calls write(f) with a scratch file next to path open for writing,
+        then moves the file into place, so readers never see path partly
+        written.  With directory set, write(dirname) fills a scratch
+        directory instead, which replaces any directory already at path.
+        The scratch copy is removed if anything fails.
+    """
+
+    parent = os.path.dirname(path) or "."
+    if directory:
+        scratch = tempfile.mkdtemp(dir=parent)
+    else:
+        fd, scratch = tempfile.mkstemp(dir=parent)
+    try:
+        if directory:
+            write(scratch)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        else:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+        os.rename(scratch, path)
+    except:
+        if directory:
+            shutil.rmtree(scratch, ignore_errors=True)
+        elif os.path.exists(scratch):
+            os.remove(scratch)
+        raise
+
+
+#### EOF ####################################################################
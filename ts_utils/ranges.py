@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+ranges.py
+
+Range selection on sorted time series.
+
+Copyright (c) 2011 Vaught Consulting.
+License: BSD
+"""
+
+
+def range_slice(dates, low, high):
+    """ Returns the slice of the sorted dates array falling within low and
+        high (inclusive), found by binary search.  Indexing a series with
+        it gives a view rather than a copy.
+    """
+
+    start = dates.searchsorted(low, side='left')
+    stop = dates.searchsorted(high, side='right')
+    return slice(start, max(start, stop))
+
+
+#### EOF ####################################################################
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+test_csv_reader.py
+
+Copyright (c) 2011 Vaught Consulting.
+License: BSD
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from ts_utils import csv_reader
+
+csv_text = ('"Date","Metric 2","Metric 1"\n'
+            '"1969-07-01",100.98,103.06\n'
+            '"1969-08-01",100.22,102.9\n'
+            '\n'
+            '"1969-08-01",99.27,102.58\n')
+
+
+class TestCSVReader(object):
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "series.csv")
+        with open(self.filename, "w") as f:
+            f.write(csv_text)
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read(self):
+        """ Columns are named from the header and typed, dates in seconds."""
+        recs = csv_reader.read_time_series_from_csv(self.filename,
+            dtype=['float64', 'float32', 'float32'], date_col=0,
+            date_format="%Y-%m-%d", sidecar=False)
+        assert isinstance(recs, np.recarray)
+        assert recs.dtype.names == ("Date", "Metric 2", "Metric 1")
+        assert recs["Metric 1"].dtype == np.float32
+        assert len(recs) == 3
+        assert recs["Date"][0] == time.mktime(time.strptime("1969-07-01",
+                                                            "%Y-%m-%d"))
+        assert recs["Date"][1] == recs["Date"][2]
+        np.testing.assert_array_almost_equal(recs["Metric 2"],
+                                             [100.98, 100.22, 99.27], 4)
+
+    def test_chunks(self):
+        """ Streaming in blocks gives the same rows."""
+        blocks = list(csv_reader.iter_time_series_csv(self.filename,
+            dtype=['float64', 'float32', 'float32'], date_col=0,
+            date_format="%Y-%m-%d", chunk_size=2))
+        assert [len(block) for block in blocks] == [2, 1]
+        whole = csv_reader.read_time_series_from_csv(self.filename,
+            dtype=['float64', 'float32', 'float32'], date_col=0,
+            date_format="%Y-%m-%d", sidecar=False)
+        np.testing.assert_array_equal(np.concatenate(blocks), whole)
+
+    def test_ragged(self):
+        """ A line with the wrong number of fields is reported by number."""
+        with open(self.filename, "a") as f:
+            f.write('"1969-09-01",98.14\n')
+        blocks = csv_reader.iter_time_series_csv(self.filename,
+            dtype=['float64', 'float32', 'float32'], date_col=0,
+            date_format="%Y-%m-%d", chunk_size=2)
+        try:
+            list(blocks)
+        except ValueError, e:
+            assert "line 6:" in str(e)
+        else:
+            raise AssertionError("ragged line should not load")
+
+    def test_quotes(self):
+        """ Quotes are stripped from each token that has them."""
+        with open(self.filename, "w") as f:
+            f.write('Date,"Metric 2",Metric 1\n'
+                    '1969-07-01,"100.98",103.06\n')
+        recs = csv_reader.read_time_series_from_csv(self.filename,
+            dtype=['float64', 'float32', 'float32'], date_col=0,
+            date_format="%Y-%m-%d", sidecar=False)
+        assert recs.dtype.names == ("Date", "Metric 2", "Metric 1")
+        np.testing.assert_almost_equal(recs["Metric 2"][0], 100.98, 4)
+
+    def test_sidecar(self):
+        """ A second load maps the sidecar, until the csv changes."""
+        options = dict(dtype=['float64', 'float32', 'float32'], date_col=0,
+                       date_format="%Y-%m-%d")
+        parsed = csv_reader.read_time_series_from_csv(self.filename,
+                                                      **options)
+        sidecars = glob.glob(self.filename + ".*.npy")
+        assert len(sidecars) == 1
+
+        mapped = csv_reader.read_time_series_from_csv(self.filename,
+                                                      **options)
+        assert isinstance(mapped, np.recarray)
+        assert isinstance(mapped.base, np.memmap)
+        np.testing.assert_array_equal(mapped, parsed)
+
+        with open(self.filename, "a") as f:
+            f.write('"1969-09-01",98.14,102.08\n')
+        changed = csv_reader.read_time_series_from_csv(self.filename,
+                                                       **options)
+        assert len(changed) == 4
+        assert glob.glob(self.filename + ".*.npy") != sidecars
+
+    def test_sidecar_options(self):
+        """ Each set of options, time zone included, keeps its own sidecar."""
+        options = dict(dtype=['float64', 'float32', 'float32'], date_col=0,
+                       date_format="%Y-%m-%d")
+        csv_reader.read_time_series_from_csv(self.filename, **options)
+        csv_reader.read_time_series_from_csv(self.filename, date_col=None,
+            dtype=['S10', 'float32', 'float32'])
+        sidecars = glob.glob(self.filename + ".*.npy")
+        assert len(sidecars) == 2
+
+        old_tz = os.environ.get("TZ")
+        os.environ["TZ"] = "UTC" if old_tz == "America/Chicago" \
+                           else "America/Chicago"
+        time.tzset()
+        try:
+            other = csv_reader.read_time_series_from_csv(self.filename,
+                                                         **options)
+            assert not isinstance(other.base, np.memmap)
+        finally:
+            if old_tz is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = old_tz
+            time.tzset()
+        assert len(glob.glob(self.filename + ".*.npy")) == 3
+
+    def test_date_parser(self):
+        """ Each distinct date string is parsed once."""
+        parser = csv_reader.DateParser("%Y-%m-%d")
+        assert parser("1969-07-01") == parser("1969-07-01")
+        assert len(parser._seconds) == 1
+
+
+# EOF ####################################################################
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+test_files.py
+
+Copyright (c) 2011 Vaught Consulting.
+License: BSD
+"""
+
+import os
+import shutil
+import tempfile
+
+from ts_utils import write_atomically
+
+
+class TestWriteAtomically(object):
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_file(self):
+        """ Replaces the file and leaves no scratch behind."""
+        path = os.path.join(self.tmpdir, "entry")
+        write_atomically(path, lambda f: f.write("old"))
+        write_atomically(path, lambda f: f.write("new"))
+        assert open(path).read() == "new"
+        assert os.listdir(self.tmpdir) == ["entry"]
+
+    def test_directory(self):
+        """ Replaces the whole directory."""
+        path = os.path.join(self.tmpdir, "entry")
+        def fill(name):
+            def write(dirname):
+                open(os.path.join(dirname, name), "w").close()
+            return write
+        write_atomically(path, fill("a"), directory=True)
+        write_atomically(path, fill("b"), directory=True)
+        assert os.listdir(path) == ["b"]
+        assert os.listdir(self.tmpdir) == ["entry"]
+
+    def test_failure(self):
+        """ A failed write keeps the old copy and cleans up."""
+        path = os.path.join(self.tmpdir, "entry")
+        write_atomically(path, lambda f: f.write("old"))
+        def fail(f_or_dirname):
+            raise ValueError("no good")
+        for directory in [False, True]:
+            try:
+                write_atomically(path, fail, directory=directory)
+            except ValueError:
+                pass
+            else:
+                assert False, "write error was swallowed"
+            assert open(path).read() == "old"
+            assert os.listdir(self.tmpdir) == ["entry"]
+
+
+# EOF ####################################################################
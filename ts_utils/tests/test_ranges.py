@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+test_ranges.py
+
+Copyright (c) 2011 Vaught Consulting.
+License: BSD
+"""
+
+import numpy as np
+from ts_utils import range_slice
+
+
+def test_range_slice():
+    """ Matches the boolean mask selection, as a view."""
+    dates = np.array([1., 2., 2., 4., 7., 9.], dtype='float32')
+    series = np.arange(6.)
+    for low, high in [(2., 7.), (0., 1.5), (3., 3.5), (9., 20.), (8., 3.)]:
+        sel = range_slice(dates, low, high)
+        mask = (dates >= low) & (dates <= high)
+        np.testing.assert_array_equal(series[sel], series[mask])
+    assert series[range_slice(dates, 2., 7.)].base is series
+
+
+# EOF ####################################################################